@@ -7,6 +7,7 @@ import multiprocessing as mp
 import os
 import pickle
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from dataclasses import dataclass, field
 from datetime import datetime
@@ -39,6 +40,7 @@ T = TypeVar("T", bound=Union[Dataset, DatasetDict])
 MODEL_BATCH_SIZE = 4
 CHUNK_SIZE_GB = 2.0
 MAX_SENTENCE_LEN = 256
+CHUNK_MANIFEST = "chunks.json"
 
 
 def check_use_baukit(model_name):
@@ -238,6 +240,9 @@ def chunk_and_tokenize(
 
         return output
 
+    if not tokenizer.is_fast:
+        print(f"Warning: {type(tokenizer).__name__} is not a fast tokenizer, tokenization will be slow")
+
     data = data.map(
         _tokenize_fn,
         # Batching is important for ensuring that we don't waste tokens
@@ -249,8 +254,10 @@ def chunk_and_tokenize(
         remove_columns=get_columns_all_equal(data),
         load_from_cache_file=load_from_cache_file,
     )
-    total_bytes: float = sum(data["bytes"])
-    total_tokens: float = sum(data["length"])
+    # reduce the Arrow columns in numpy rather than iterating over them in Python
+    numpy_data = data.with_format("numpy", columns=["bytes", "length"])
+    total_bytes: float = int(numpy_data["bytes"].sum())
+    total_tokens: float = int(numpy_data["length"].sum())
     return data.with_format(format, columns=["input_ids"]), (total_tokens / total_bytes) / math.log(2)
 
 
@@ -384,7 +391,8 @@ def make_activation_dataset(
     n_chunks: int = 1,
     max_length: int = 256,
     model_batch_size: int = 4,
-    center_dataset: bool = False
+    center_dataset: bool = False,
+    quantize_int8: bool = False
 ) -> pd.DataFrame:
     print(f"Running model and saving activations to {dataset_folder}")
     with torch.no_grad():
@@ -395,6 +403,9 @@ def make_activation_dataset(
         actives_per_chunk = chunk_size // activation_size
         dataset = []
         n_saved_chunks = 0
+        # save chunks on a background thread so the model keeps running, with at most one save in flight
+        saver = ThreadPoolExecutor(max_workers=1)
+        pending_save = None
         for batch_idx, batch in tqdm(enumerate(sentence_dataset)):
             batch = batch["input_ids"].to("cuda:0")
             if baukit:
@@ -419,7 +430,12 @@ def make_activation_dataset(
                     dataset = [x - chunk_mean for x in dataset]
                     
                 # Need to save, restart the list
-                save_activation_chunk(dataset, n_saved_chunks, dataset_folder)
+                if pending_save is not None:
+                    pending_save.result()
+                chunk, copy_done = activations_to_host(dataset)
+                pending_save = saver.submit(
+                    save_activation_chunk, chunk, n_saved_chunks, dataset_folder, quantize_int8=quantize_int8, copy_done=copy_done
+                )
                 n_saved_chunks += 1
                 print(f"Saved chunk {n_saved_chunks} of activations, total size:  {batch_idx * activation_size} ")
                 dataset = []
@@ -427,9 +443,18 @@ def make_activation_dataset(
                     break
 
         if n_saved_chunks < n_chunks:
-            save_activation_chunk(dataset, n_saved_chunks, dataset_folder)
+            if pending_save is not None:
+                pending_save.result()
+            chunk, copy_done = activations_to_host(dataset)
+            pending_save = saver.submit(
+                save_activation_chunk, chunk, n_saved_chunks, dataset_folder, quantize_int8=quantize_int8, copy_done=copy_done
+            )
             print(f"Saved undersized chunk {n_saved_chunks} of activations, total size:  {batch_idx * activation_size} ")
 
+        if pending_save is not None:
+            pending_save.result()
+        saver.shutdown(wait=True)
+
 
 def make_activation_dataset_hf(
     sentence_dataset: DataLoader,
@@ -444,7 +469,8 @@ def make_activation_dataset_hf(
     max_length: int = 256,
     model_batch_size: int = 4,
     skip_chunks: int = 0,
-    center_dataset: bool = False
+    center_dataset: bool = False,
+    quantize_int8: bool = False
 ):
     
     with torch.no_grad():
@@ -465,6 +491,10 @@ def make_activation_dataset_hf(
         for _ in range(batches_to_skip):
             dataset_iterator.__next__()
 
+        # save chunks on a background thread so the model keeps running, with at most one chunk's saves in flight
+        saver = ThreadPoolExecutor(max_workers=1)
+        pending_saves = []
+
         for chunk_idx in range(n_chunks):
             datasets: Dict[int, List] = {layer: [] for layer in layers}
             for batch_idx, batch in tqdm(enumerate(dataset_iterator)):
@@ -481,28 +511,105 @@ def make_activation_dataset_hf(
                 if batch_idx >= max_batches_per_chunk:
                     break
 
+            for pending_save in pending_saves:
+                pending_save.result()
+            pending_saves = []
+            undersized = len(datasets[layers[0]]) < max_batches_per_chunk
             for layer, folder in zip(layers, dataset_folders):
-                dataset = datasets[layer]
+                # pop, so each layer's activations are freed on the device once they've been copied to the host
+                dataset = datasets.pop(layer)
                 if center_dataset:
                     if chunk_idx == 0:
                         chunk_means[layer] = torch.mean(torch.cat(dataset), dim=0)
                     dataset = [x - chunk_means[layer]  for x in dataset]
-                save_activation_chunk(dataset, chunk_idx, folder)
+                chunk, copy_done = activations_to_host(dataset)
+                del dataset
+                pending_saves.append(
+                    saver.submit(save_activation_chunk, chunk, chunk_idx, folder, quantize_int8=quantize_int8, copy_done=copy_done)
+                )
 
-            if len(datasets[layer]) < max_batches_per_chunk:
+            if undersized:
                 print(f"Saved undersized chunk {chunk_idx} of activations, total size: {batch_idx * activation_size}")
                 break
             else:
                 print(f"Saved chunk {chunk_idx} of activations, total size: {(chunk_idx + 1) * batch_idx * activation_size}")
+
+        for pending_save in pending_saves:
+            pending_save.result()
+        saver.shutdown(wait=True)
     
     #return ((chunk_means, chunk_stds) if center_dataset else None, n_activations)
     return n_activations
 
-def save_activation_chunk(dataset, n_saved_chunks, dataset_folder):
-    dataset_t = torch.cat(dataset, dim=0).to("cpu")
+def activations_to_host(dataset: List[torch.Tensor]) -> Tuple[torch.Tensor, Optional[torch.cuda.Event]]:
+    """Concatenates a chunk's activations and starts copying them into pinned host memory.
+    For CUDA activations, also returns an event that is done once the copy has finished."""
+    dataset_t = torch.cat(dataset, dim=0)
+    if dataset_t.device.type != "cuda":
+        return dataset_t, None
+    host_t = torch.empty(dataset_t.shape, dtype=dataset_t.dtype, pin_memory=True)
+    host_t.copy_(dataset_t, non_blocking=True)
+    copy_done = torch.cuda.Event()
+    copy_done.record(torch.cuda.current_stream(dataset_t.device))
+    return host_t, copy_done
+
+
+def save_activation_chunk(dataset, n_saved_chunks, dataset_folder, quantize_int8=False, copy_done=None):
+    """Saves `dataset`, a list of activation batches or an already concatenated tensor, as chunk `n_saved_chunks`.
+    If given, waits on the `copy_done` event from activations_to_host first."""
+    if copy_done is not None:
+        copy_done.synchronize()
+    dataset_t = dataset if isinstance(dataset, torch.Tensor) else torch.cat(dataset, dim=0)
     os.makedirs(dataset_folder, exist_ok=True)
-    with open(dataset_folder + "/" + str(n_saved_chunks) + ".pt", "wb") as f:
-        torch.save(dataset_t, f)
+    if quantize_int8:
+        # symmetric per-dimension int8, with the float32 scales saved alongside the chunk
+        scale = dataset_t.abs().amax(dim=0).float().clamp_min(1e-8) / 127
+        dataset_t = (dataset_t.float() / scale).round_().clamp_(-127, 127).to(torch.int8)
+        np.save(os.path.join(dataset_folder, f"{n_saved_chunks}_scale.npy"), scale.cpu().numpy())
+    # saved as a raw .npy so that it can be memory-mapped by load_activation_chunk
+    np.save(os.path.join(dataset_folder, f"{n_saved_chunks}.npy"), dataset_t.cpu().numpy())
+    update_chunk_manifest(dataset_folder, n_saved_chunks, dataset_t.shape[0])
+
+
+def read_chunk_manifest(dataset_folder) -> Optional[Dict[str, int]]:
+    """Returns the {chunk_idx: n_rows} manifest written alongside the chunks, or None for older datasets"""
+    manifest_loc = os.path.join(dataset_folder, CHUNK_MANIFEST)
+    if not os.path.exists(manifest_loc):
+        return None
+    with open(manifest_loc) as f:
+        return json.load(f)
+
+
+def update_chunk_manifest(dataset_folder, chunk_idx, n_rows):
+    manifest = read_chunk_manifest(dataset_folder) or {}
+    manifest[str(chunk_idx)] = int(n_rows)
+    with open(os.path.join(dataset_folder, CHUNK_MANIFEST), "w") as f:
+        json.dump(manifest, f)
+
+
+def load_activation_chunk(dataset_folder, chunk_idx, mmap=True):
+    """Loads chunk `chunk_idx` from `dataset_folder`, memory-mapping it if it was saved as .npy.
+    Falls back to the older torch.save'd `{chunk_idx}.pt` chunks. int8 chunks are dequantized to float32."""
+    npy_loc = os.path.join(dataset_folder, f"{chunk_idx}.npy")
+    if os.path.exists(npy_loc):
+        # copy-on-write so the returned tensor is writable without touching the file
+        chunk = torch.from_numpy(np.load(npy_loc, mmap_mode="c" if mmap else None))
+        scale_loc = os.path.join(dataset_folder, f"{chunk_idx}_scale.npy")
+        if os.path.exists(scale_loc):
+            chunk = chunk.to(torch.float32).mul_(torch.from_numpy(np.load(scale_loc)).to(torch.float32))
+        return chunk
+    return torch.load(os.path.join(dataset_folder, f"{chunk_idx}.pt"), map_location="cpu")
+
+
+def count_activation_chunks(dataset_folder):
+    """Number of consecutively numbered activation chunks in `dataset_folder`, ignoring any other files"""
+    manifest = read_chunk_manifest(dataset_folder)
+    if manifest is not None:
+        return len(manifest)
+    n_chunks = 0
+    while any(os.path.exists(os.path.join(dataset_folder, f"{n_chunks}{ext}")) for ext in [".npy", ".pt"]):
+        n_chunks += 1
+    return n_chunks
 
 
 def setup_data(
@@ -518,7 +625,8 @@ def setup_data(
     skip_chunks: int = 0,
     device: torch.device = torch.device("cuda:0"),
     center_dataset: bool = False,
-    is_othello: bool = False
+    is_othello: bool = False,
+    quantize_int8: bool = False
 ):
     layers = [layer] if isinstance(layer, int) else layer
 
@@ -557,6 +665,7 @@ def setup_data(
             max_length=MAX_SENTENCE_LEN,
             model_batch_size=MODEL_BATCH_SIZE,
             center_dataset=center_dataset,
+            quantize_int8=quantize_int8,
         )
     else:
         dataset_folder = [dataset_folder] if isinstance(dataset_folder, str) else dataset_folder
@@ -573,7 +682,8 @@ def setup_data(
             max_length=MAX_SENTENCE_LEN,
             model_batch_size=MODEL_BATCH_SIZE,
             skip_chunks=skip_chunks,
-            center_dataset=center_dataset
+            center_dataset=center_dataset,
+            quantize_int8=quantize_int8
         )
         return n_datapoints
 
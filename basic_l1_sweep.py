@@ -9,6 +9,7 @@ import numpy as np
 
 from autoencoders.sae_ensemble import FunctionalTiedSAE
 from autoencoders.ensemble import FunctionalEnsemble
+from activation_dataset import count_activation_chunks, load_activation_chunk
 from big_sweep import ensemble_train_loop, unstacked_to_learned_dicts
 from config import TrainArgs, EnsembleArgs
 
@@ -52,11 +53,11 @@ def basic_l1_sweep(
 ):
     # get dataset size
     
-    # check that dataset_dir/0.pt exists
+    # check that dataset_dir/0.npy or dataset_dir/0.pt exists
 
-    assert os.path.exists(os.path.join(dataset_dir, '0.pt')), "Dataset not found at {}".format(dataset_dir)
+    assert any(os.path.exists(os.path.join(dataset_dir, '0' + ext)) for ext in ['.npy', '.pt']), "Dataset not found at {}".format(dataset_dir)
 
-    dataset = torch.load(os.path.join(dataset_dir, '0.pt'))
+    dataset = load_activation_chunk(dataset_dir, 0)
     activation_dim = dataset.shape[1]
     latent_dim = int(activation_dim * ratio)
     del dataset
@@ -79,7 +80,7 @@ def basic_l1_sweep(
 
     print("Training...")
 
-    n_chunks = len(os.listdir(dataset_dir))
+    n_chunks = count_activation_chunks(dataset_dir)
 
     os.makedirs(output_dir, exist_ok=True)
 
@@ -87,8 +88,7 @@ def basic_l1_sweep(
         chunk_order = np.random.permutation(n_chunks)
 
         for chunk_idx, chunk in enumerate(chunk_order):
-            assert os.path.exists(os.path.join(dataset_dir, '{}.pt'.format(chunk))), "Chunk not found at {}".format(os.path.join(dataset_dir, '{}.pt'.format(chunk)))
-            dataset = torch.load(os.path.join(dataset_dir, '{}.pt'.format(chunk))).to(dtype=torch.float32)
+            dataset = load_activation_chunk(dataset_dir, chunk).to(dtype=torch.float32)
             dataset.pin_memory()
 
             sampler = torch.utils.data.BatchSampler(
@@ -4,6 +4,7 @@ import os
 import pickle
 import sys
 from itertools import chain, product
+from math import ceil, isclose
 import yaml
 
 import numpy as np
@@ -20,11 +21,16 @@ from transformers import GPT2Tokenizer
 import standard_metrics
 import wandb
 from activation_dataset import (check_transformerlens_model,
-                                get_activation_size, setup_data)
+                                count_activation_chunks, get_activation_size,
+                                load_activation_chunk, read_chunk_manifest,
+                                setup_data)
 from autoencoders.learned_dict import LearnedDict, TiedSAE, UntiedSAE
 from cluster_runs import dispatch_job_on_chunk
 from sc_datasets.random_dataset import SparseMixDataset
 
+# number of training steps between wandb logs in ensemble_train_loop
+LOG_EVERY = 100
+
 
 def get_model(cfg):
     if cfg.is_othello:
@@ -76,8 +82,6 @@ def calc_expected_interference(dictionary, batch):
 
 
 def filter_learned_dicts(learned_dicts, hyperparam_filters):
-    from math import isclose
-
     filtered_learned_dicts = []
     for learned_dict, hyperparams in learned_dicts:
         if all(
@@ -182,35 +186,88 @@ def ensemble_train_loop(ensemble, cfg, args, ensemble_name, sampler, dataset, pr
     if cfg.use_wandb:
         run = cfg.wandb_instance
 
+        # the hyperparameters don't change during training, so build each model's log key prefix once
+        log_prefixes = []
+        for m in range(ensemble.n_models):
+            hyperparam_values = {}
+
+            for ep in cfg.ensemble_hyperparams:
+                if ep in args:
+                    hyperparam_values[ep] = args[ep]
+                else:
+                    raise ValueError(f"Hyperparameter {ep} not found in args")
+
+            for bp in cfg.buffer_hyperparams:
+                if bp in ensemble.buffers:
+                    hyperparam_values[bp] = ensemble.buffers[bp][m].item()
+                else:
+                    raise ValueError(f"Hyperparameter {bp} not found in buffers")
+
+            log_prefixes.append(f"{ensemble_name}_{make_hyperparam_name(hyperparam_values)}")
+        log_keys = None
+
+    # gather batches into two alternating pinned staging buffers so the H2D copy
+    # can run asynchronously and overlap with the previous step
+    pin = torch.device(args["device"]).type == "cuda"
+    if pin:
+        staging = [torch.empty((args["batch_size"], dataset.shape[1]), dtype=dataset.dtype).pin_memory() for _ in range(2)]
+        copy_done = [None, None]
+
+    # running sums of the per-model metrics, kept on device between logging steps
+    running_losses = None
+    running_num_nonzero = torch.zeros(ensemble.n_models, device=args["device"])
+    ever_active = None
+    n_running = 0
+
     for i, batch_idxs in enumerate(sampler):
-        batch = dataset[batch_idxs].to(args["device"])
+        if pin:
+            buf = i % 2
+            if copy_done[buf] is not None:
+                copy_done[buf].synchronize()
+            staged = staging[buf][: len(batch_idxs)]
+            torch.index_select(dataset, 0, torch.tensor(batch_idxs), out=staged)
+            batch = staged.to(args["device"], non_blocking=True)
+            copy_done[buf] = torch.cuda.Event()
+            copy_done[buf].record(torch.cuda.current_stream(args["device"]))
+        else:
+            batch = dataset[batch_idxs].to(args["device"])
         losses, aux_buffer = ensemble.step_batch(batch)
 
-        num_nonzero = aux_buffer["c"].count_nonzero(dim=-1).float().mean(dim=-1)
-
         if cfg.use_wandb:
-            log = {}
+            # one nonzero mask feeds both the sparsity and the dead feature reductions
+            nz = aux_buffer["c"] != 0
+            if running_losses is None:
+                running_losses = {k: torch.zeros_like(v, dtype=torch.float32) for k, v in losses.items()}
+                ever_active = torch.zeros(nz.shape[0], nz.shape[-1], dtype=torch.bool, device=nz.device)
+            for k, v in losses.items():
+                running_losses[k].add_(v)
+            running_num_nonzero.add_(nz.sum(dim=-1).float().mean(dim=-1))
+            ever_active.logical_or_(nz.any(dim=-2))
+            n_running += 1
+
+        # only sync the running averages back to the host on logging steps, and flush them at the end of the chunk
+        if cfg.use_wandb and (i % LOG_EVERY == 0 or i == len(sampler) - 1):
+            loss_keys = list(running_losses.keys())
+            stats = torch.stack([running_losses[k] for k in loss_keys] + [running_num_nonzero]) / n_running
+            stats = torch.cat([stats, (~ever_active).sum(dim=-1).float()[None]]).tolist()
+            mean_losses = dict(zip(loss_keys, stats[:-2]))
+            num_nonzero, n_dead = stats[-2], stats[-1]
+            for v in running_losses.values():
+                v.zero_()
+            running_num_nonzero.zero_()
+            ever_active.zero_()
+            n_running = 0
+
+            if log_keys is None:
+                metric_names = loss_keys + ["num_nonzero", "n_dead"]
+                log_keys = [[f"{prefix}_{k}" for k in metric_names] for prefix in log_prefixes]
+
+            # values are already python floats, so wandb has nothing left to sync
+            # the ensembles log to one run in parallel, so their charts are plotted against batch_idx, not wandb's step
+            log = {"batch_idx": cfg.n_batches_done + i}
             for m in range(ensemble.n_models):
-                hyperparam_values = {}
-
-                for ep in cfg.ensemble_hyperparams:
-                    if ep in args:
-                        hyperparam_values[ep] = args[ep]
-                    else:
-                        raise ValueError(f"Hyperparameter {ep} not found in args")
-
-                for bp in cfg.buffer_hyperparams:
-                    if bp in ensemble.buffers:
-                        hyperparam_values[bp] = ensemble.buffers[bp][m].item()
-                    else:
-                        raise ValueError(f"Hyperparameter {bp} not found in buffers")
-
-                name = make_hyperparam_name(hyperparam_values)
-
-                for k in losses.keys():
-                    log[f"{ensemble_name}_{name}_{k}"] = losses[k][m].item()
-
-                log[f"{ensemble_name}_{name}_num_nonzero"] = num_nonzero[m].item()
+                metric_values = [mean_losses[k][m] for k in loss_keys] + [num_nonzero[m], n_dead[m]]
+                log.update(zip(log_keys[m], metric_values))
 
             run.log(log, commit=True)
 
@@ -286,16 +343,20 @@ def init_model_dataset(cfg):
             device=cfg.device,
             chunk_size_gb=cfg.chunk_size_gb,
             center_dataset=cfg.center_dataset,
-            is_othello=cfg.is_othello
+            is_othello=cfg.is_othello,
+            quantize_int8=cfg.quantize_int8,
         )
         del transformer, tokenizer
         return n_datapoints
     else:
         print(f"Activations in {cfg.dataset_folder} already exist, loading them")
+        manifest = read_chunk_manifest(cfg.dataset_folder)
+        if manifest is not None:
+            return sum(manifest.values())
         n_datapoints = 0
-        n_files = len(os.listdir(cfg.dataset_folder))
+        n_files = count_activation_chunks(cfg.dataset_folder)
         for i in tqdm.tqdm(range(n_files)):
-            n_datapoints += torch.load(os.path.join(cfg.dataset_folder, f"{i}.pt"), map_location="cpu").shape[0]
+            n_datapoints += load_activation_chunk(cfg.dataset_folder, i).shape[0]
         return n_datapoints
 
 
@@ -377,18 +438,24 @@ def sweep(ensemble_init_func, cfg):
 
     print("Ensembles initialised.")
 
-    n_chunks = len(os.listdir(cfg.dataset_folder))
+    n_chunks = count_activation_chunks(cfg.dataset_folder)
 
     chunk_order = np.random.permutation(n_chunks)
 
     if cfg.n_repetitions is not None:
         chunk_order = np.tile(chunk_order, cfg.n_repetitions)
 
+    # batches trained on in earlier chunks, which ensemble_train_loop adds to its batch_idx metric
+    cfg.n_batches_done = 0
+    if cfg.use_wandb:
+        cfg.wandb_instance.define_metric("batch_idx")
+        for _, _, tag in ensembles:
+            cfg.wandb_instance.define_metric(f"{tag}_*", step_metric="batch_idx")
+
     for i, chunk_idx in enumerate(chunk_order):
         print(f"Chunk {i+1}/{len(chunk_order)}")
 
-        chunk_loc = os.path.join(cfg.dataset_folder, f"{chunk_idx}.pt")
-        chunk = torch.load(chunk_loc).to(device="cpu", dtype=torch.float32)
+        chunk = load_activation_chunk(cfg.dataset_folder, chunk_idx).to(device="cpu", dtype=torch.float32)
         if cfg.center_activations:
             if i == 0:
                 print("Centring activations")
@@ -397,6 +464,7 @@ def sweep(ensemble_init_func, cfg):
             chunk -= means
 
         dispatch_job_on_chunk(ensembles, cfg, chunk, ensemble_train_loop)
+        cfg.n_batches_done += ceil(chunk.shape[0] / cfg.batch_size)
 
         learned_dicts = []
         for ensemble, arg, _ in ensembles:
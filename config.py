@@ -4,6 +4,9 @@ from typing import Any, Optional
 
 import torch
 
+# Write buffer size for pickled outputs
+PICKLE_BUFFER_SIZE = 1 << 20
+
 @dataclass
 class BaseArgs:
     def parse_args(self) -> argparse.Namespace:
@@ -41,6 +44,7 @@ class TrainArgs(BaseArgs):
     dtype: torch.dtype = torch.float32
     epochs: int = 1
     center_dataset: bool = False
+    quantize_int8: bool = False
     n_chunks: int = 30
     chunk_size_gb: float = 2.0
     batch_size: int = 256
@@ -108,6 +112,8 @@ class ToyArgs(BaseArgs):
     noise_level: float = 0.0
     n_components_dictionary: int = 512
     l1_alpha: float = 1e-3
+    mixed_precision: bool = False
+    share_decoder_init: bool = False
 
 @dataclass
 class InterpArgs(BaseArgs):
@@ -17,7 +17,7 @@ import tqdm
 import wandb
 
 from autoencoders.learned_dict import LearnedDict
-from activation_dataset import get_activation_size, setup_data
+from activation_dataset import count_activation_chunks, get_activation_size, load_activation_chunk, setup_data
 from big_sweep import get_model
 from config import BaseArgs
 
@@ -175,7 +175,7 @@ def process_reinit(rank, cfg, world_size):
 
     for chunk_idx in cfg.chunk_order:
         # load data
-        dataset = torch.load(f"{cfg.dataset_folder}/{chunk_idx}.pt", map_location="cpu")
+        dataset = load_activation_chunk(cfg.dataset_folder, chunk_idx)
         ndx_dataset = DatasetWithIndex(dataset)
 
         loader = torch.utils.data.DataLoader(
@@ -284,7 +284,7 @@ def process_main(rank, cfg, world_size):
     for chunk_idx in cfg.chunk_order:
         print("starting chunk")
         # load data
-        dataset = torch.load(f"{cfg.dataset_folder}/{chunk_idx}.pt", map_location="cpu")
+        dataset = load_activation_chunk(cfg.dataset_folder, chunk_idx)
 
         if rank == 0:
             print(dataset.shape[0] // (world_size * cfg.batch_size))
@@ -414,7 +414,7 @@ def single_gpu_reinit():
 def make_dataset(cfg):
     cfg.activation_width = get_activation_size(cfg.model_name, cfg.layer_loc)
 
-    if not os.path.exists(cfg.dataset_folder) or len(os.listdir(cfg.dataset_folder)) < cfg.n_chunks:
+    if count_activation_chunks(cfg.dataset_folder) < cfg.n_chunks:
         print(f"Activations in {cfg.dataset_folder} do not exist, creating them")
         transformer, tokenizer = get_model(cfg)
         n_datapoints = setup_data(
@@ -6,6 +6,7 @@ sys.path.append(os.getcwd())
 
 import torch
 
+from activation_dataset import load_activation_chunk
 from interpret import read_transform_scores
 from standard_metrics import calc_moments_streaming
 
@@ -33,7 +34,7 @@ def main(device: str) -> None:
     l4_norm_correlations = []
     
     for layer in layers:
-        chunk = torch.load(os.path.join("/mnt/ssd-cluster/single_chunks", f"l{layer}_residual", "0.pt"))
+        chunk = load_activation_chunk(os.path.join("/mnt/ssd-cluster/single_chunks", f"l{layer}_residual"), 0)
         chunk = chunk.to(torch.float32).to(device)
         for ratio_str in ratio_strs:
             run_folder = f"tied_residual_l{layer}_r{ratio_str[0]}"
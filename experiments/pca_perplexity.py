@@ -10,6 +10,7 @@ from datasets import Dataset, load_dataset
 from transformer_lens import HookedTransformer
 
 import standard_metrics
+from activation_dataset import load_activation_chunk
 from autoencoders.learned_dict import AddedNoise, LearnedDict
 from autoencoders.pca import BatchedPCA, PCAEncoder
 
@@ -56,7 +57,7 @@ if __name__ == "__main__":
 
     print(tokens.shape)
 
-    dataset = torch.load(os.path.join(BASE_FOLDER, "activation_data_layers/layer_2/0.pt")).to(dtype=torch.float32, device=device)
+    dataset = load_activation_chunk(os.path.join(BASE_FOLDER, "activation_data_layers/layer_2"), 0).to(dtype=torch.float32, device=device)
     pca = train_pca(dataset)
 
     sample_idxs = np.random.choice(len(dataset), 10000, replace=False)
@@ -25,7 +25,7 @@ from datasets import load_dataset
 from transformer_lens import HookedTransformer
 
 from activation_dataset import check_use_baukit, make_tensor_name
-from config import BaseArgs, InterpArgs, InterpGraphArgs
+from config import PICKLE_BUFFER_SIZE, BaseArgs, InterpArgs, InterpGraphArgs
 from autoencoders.learned_dict import LearnedDict
 
 # set OPENAI_API_KEY environment variable from secrets.json['openai_key']
@@ -374,11 +374,10 @@ async def interpret(base_df: pd.DataFrame, save_folder: str, n_feats_to_explain:
         feature_name = f"feature_{feat_n}"
         feature_folder = os.path.join(save_folder, feature_name)
         os.makedirs(feature_folder, exist_ok=True)
-        pickle.dump(
-            scored_simulation,
-            open(os.path.join(feature_folder, "scored_simulation.pkl"), "wb"),
-        )
-        pickle.dump(neuron_record, open(os.path.join(feature_folder, "neuron_record.pkl"), "wb"))
+        with open(os.path.join(feature_folder, "scored_simulation.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+            pickle.dump(scored_simulation, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(feature_folder, "neuron_record.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+            pickle.dump(neuron_record, f, protocol=pickle.HIGHEST_PROTOCOL)
         # write a file with the explanation and the score
         with open(os.path.join(feature_folder, "explanation.txt"), "w") as f:
             f.write(
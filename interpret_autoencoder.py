@@ -26,10 +26,11 @@ from datasets import load_dataset
 from transformer_lens import HookedTransformer, HookedTransformerConfig
 
 from activation_dataset import check_use_baukit, make_tensor_name
-from config import BaseArgs, InterpArgs, InterpGraphArgs
+from config import PICKLE_BUFFER_SIZE, BaseArgs, InterpArgs, InterpGraphArgs
 from autoencoders.learned_dict import LearnedDict
 from othello_utils import othello_utils
-from scipy.stats import spearmanr, pointbiserialr
+from scipy.stats import spearmanr
+from scipy.stats import t as t_dist
 
 # set OPENAI_API_KEY environment variable from secrets.json['openai_key']
 # needs to be done before importing openai interp bits
@@ -66,6 +67,22 @@ MAX_CONCURRENT = None
 
 BASE_FOLDER = "/mnt/ssd-cluster/sweep_interp"
 
+# plot constants for read_results
+_VIOLIN_COLORS = (
+    "red",
+    "blue",
+    "green",
+    "orange",
+    "purple",
+    "pink",
+    "black",
+    "brown",
+    "cyan",
+    "magenta",
+    "grey",
+)
+_VIOLIN_YTICKS = np.arange(-0.2, 0.6, 0.1)
+
 
 # Replaces the load_neuron function in neuron_explainer.activations.activations because couldn't get blobfile to work
 # def load_neuron(
@@ -447,11 +464,10 @@ async def interpret(base_df: pd.DataFrame, save_folder: str, n_feats_to_explain:
         feature_name = f"feature_{feat_n}"
         feature_folder = os.path.join(save_folder, feature_name)
         os.makedirs(feature_folder, exist_ok=True)
-        pickle.dump(
-            scored_simulation,
-            open(os.path.join(feature_folder, "scored_simulation.pkl"), "wb"),
-        )
-        pickle.dump(neuron_record, open(os.path.join(feature_folder, "neuron_record.pkl"), "wb"))
+        with open(os.path.join(feature_folder, "scored_simulation.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+            pickle.dump(scored_simulation, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(feature_folder, "neuron_record.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+            pickle.dump(neuron_record, f, protocol=pickle.HIGHEST_PROTOCOL)
         # write a file with the explanation and the score
         with open(os.path.join(feature_folder, "explanation.txt"), "w") as f:
             f.write(
@@ -800,24 +816,12 @@ def read_results(activation_name: str, score_mode: str) -> None:
     plt.clf()  # clear the plot
 
     # plot the scores as a violin plot
-    colors = [
-        "red",
-        "blue",
-        "green",
-        "orange",
-        "purple",
-        "pink",
-        "black",
-        "brown",
-        "cyan",
-        "magenta",
-        "grey",
-    ]
+    colors = _VIOLIN_COLORS
 
     # fix yrange from -0.2 to 0.6
     plt.ylim(-0.2, 0.6)
     # add horizontal grid lines every 0.1
-    plt.yticks(np.arange(-0.2, 0.6, 0.1))
+    plt.yticks(_VIOLIN_YTICKS)
     plt.grid(axis="y", color="grey", linestyle="-", linewidth=0.5, alpha=0.3)
     # first we need to get the scores into a list of lists
     scores_list = [scores[transform][1] for transform in transforms]
@@ -927,6 +931,37 @@ def interpret_othello(dict_location, feat_proportion=0.1,
 
 
 
+def point_biserial_matrix(labels: np.ndarray, activations: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Point-biserial correlation (and two-sided p-value) between every row of `labels` (B, N)
+    and every row of `activations` (F, N), matching scipy.stats.pointbiserialr elementwise.
+
+    The correlation matmul runs in float16 on the GPU when one is available; the
+    t-statistic and p-values are always computed in float32 on the CPU.
+    """
+    n = labels.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # z-score each row and fold in 1/sqrt(N) so that R = Bz @ Az.T lies in [-1, 1]
+        # (keeps the float16 product well clear of overflow)
+        labels_z = (labels - labels.mean(axis=1, keepdims=True)) / (labels.std(axis=1, keepdims=True) * np.sqrt(n))
+        acts_z = (activations - activations.mean(axis=1, keepdims=True)) / (
+            activations.std(axis=1, keepdims=True) * np.sqrt(n)
+        )
+
+    if torch.cuda.is_available():
+        labels_h = torch.from_numpy(labels_z).to(device="cuda", dtype=torch.float16)
+        acts_h = torch.from_numpy(acts_z).to(device="cuda", dtype=torch.float16)
+        r_matrix = (labels_h @ acts_h.T).float().cpu().numpy()
+    else:
+        r_matrix = labels_z @ acts_z.T
+    r_matrix = np.clip(r_matrix, -1.0, 1.0).astype(np.float32)
+
+    # same t-test as scipy.stats.pearsonr; constant rows give nan, as in scipy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = r_matrix * np.sqrt((n - 2) / (1.0 - r_matrix**2))
+    p_matrix = (2 * t_dist.sf(np.abs(t_stat), n - 2)).astype(np.float32)
+    return r_matrix, p_matrix
+
+
 def eval_othello(df,
                  num_ae_features=200,
                  significance_threshold=.05):
@@ -974,18 +1009,23 @@ def eval_othello(df,
                 #     activation = -1 * activation
                 feature_activations[feature_num].append(activation)
 
+    feature_names = list(board_features.keys())
+    labels = np.asarray([board_features[f] for f in feature_names], dtype=np.float32)  # (B, N)
+    activations = np.asarray([feature_activations[f] for f in feature_activations], dtype=np.float32)  # (F, N)
+    r_matrix, p_matrix = point_biserial_matrix(labels, activations)
+
     num_captured = 0
     disentangled = 0
     captured_set = set()
     disentangled_learned = set()
     correlations = {}
-    for board_feature in board_features:
-        num_occurrences = [x for x in board_features[board_feature] if x == 1]
-        if len(num_occurrences) < 10:
-            print(f"Occurences of {board_feature}: {len(num_occurrences)}")
+    for board_ndx, board_feature in enumerate(feature_names):
+        num_occurrences = int(labels[board_ndx].sum())
+        if num_occurrences < 10:
+            print(f"Occurences of {board_feature}: {num_occurrences}")
         correlations[board_feature] = {}
         for feature_num in feature_activations:
-            correlation = pointbiserialr(board_features[board_feature], feature_activations[feature_num])
+            correlation = (r_matrix[board_ndx, feature_num], p_matrix[board_ndx, feature_num])
             correlations[board_feature][feature_num] = correlation
             """
             # use quantiles to set activation threshold for classification
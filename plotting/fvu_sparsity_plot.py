@@ -15,6 +15,7 @@ from matplotlib.markers import MarkerStyle
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import standard_metrics
+from activation_dataset import load_activation_chunk
 from autoencoders.pca import BatchedPCA, PCAEncoder
 
 def score_dict(score, label, hyperparams, learned_dict, dataset, ground_truth=None):
@@ -47,7 +48,7 @@ def area_under_fvu_sparsity_curve(learned_dict_files, dataset_file=None, generat
     if dataset_file is None and generator is not None:
         dataset = torch.cat([next(generator) for _ in tqdm.tqdm(range(512))]).to(dtype=torch.float32, device=device)
     else:
-        dataset = torch.load(dataset_file).to(dtype=torch.float32, device=device)
+        dataset = load_activation_chunk(*os.path.split(os.path.splitext(dataset_file)[0])).to(dtype=torch.float32, device=device)
 
     activation_width = dataset.shape[1]
 
@@ -122,7 +123,7 @@ def generate_scores(
     if dataset_file is None and generator is not None:
         dataset = torch.cat([next(generator) for _ in tqdm.tqdm(range(512))]).to(dtype=torch.float32, device=device)
     else:
-        dataset = torch.load(dataset_file).to(dtype=torch.float32, device=device)
+        dataset = load_activation_chunk(*os.path.split(os.path.splitext(dataset_file)[0])).to(dtype=torch.float32, device=device)
 
     learned_dict_sets = {}
 
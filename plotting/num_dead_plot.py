@@ -5,6 +5,7 @@ import numpy as np
 import torch
 
 import standard_metrics
+from activation_dataset import load_activation_chunk
 
 if __name__ == "__main__":
     learned_dict_files = [0.5, 1, 2, 4, 8]
@@ -13,7 +14,7 @@ if __name__ == "__main__":
 
     datapoints = []
 
-    dataset = torch.load("activation_data/0.pt")
+    dataset = load_activation_chunk("activation_data", 0)
     sample_idxs = np.random.choice(len(dataset), 100000, replace=False)
 
     sample = dataset[sample_idxs].to(torch.float32).to("cuda:0")
@@ -14,6 +14,8 @@ plots_dir = "/mnt/ssd-cluster/plots"
 
 sys.path.append(local_dir)
 
+from activation_dataset import load_activation_chunk
+from config import PICKLE_BUFFER_SIZE
 from standard_metrics import calc_feature_n_active
 
 tied_ratios = [0, 1, 2, 4, 8, 32]
@@ -40,8 +42,8 @@ def run_for_layer(args) -> None:
         if os.geteuid() != 0:
             raise PermissionError("Must run as root to load the data")
         plt.clf()
-        chunk_loc = f"/mnt/ssd-cluster/single_chunks/l{layer}_{layer_loc}/0.pt"
-        activations = torch.load(chunk_loc).to(torch.float32).to(device)
+        chunk_folder = f"/mnt/ssd-cluster/single_chunks/l{layer}_{layer_loc}"
+        activations = load_activation_chunk(chunk_folder, 0).to(torch.float32).to(device)
         layer_data: List[Tuple[int, List[Tuple[float, float]]]] = []
         for ratio in untied_ratios:
             dicts_loc = f"untied_{layer_loc}_l{layer}_r{ratio}"
@@ -76,13 +78,8 @@ def run_for_layer(args) -> None:
 
         # save the data
         os.makedirs(plot_data_dir, exist_ok=True)
-        pickle.dump(
-            layer_data,
-            open(
-                os.path.join(plot_data_dir, f"n_active_untied_l{layer}_{layer_loc}.pkl"),
-                "wb",
-            ),
-        )
+        with open(os.path.join(plot_data_dir, f"n_active_untied_l{layer}_{layer_loc}.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+            pickle.dump(layer_data, f, protocol=pickle.HIGHEST_PROTOCOL)
         print(f"Finished layer {layer} {layer_loc}")
 
     else:
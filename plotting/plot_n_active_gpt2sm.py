@@ -14,6 +14,8 @@ PLOTS_DIR = "/mnt/ssd-cluster/plots"
 
 sys.path.append(LOCAL_DIR)
 
+from activation_dataset import load_activation_chunk
+from config import PICKLE_BUFFER_SIZE
 from standard_metrics import calc_feature_n_active
 
 
@@ -36,8 +38,8 @@ def run_for_layer(args) -> None:
         if os.geteuid() != 0:
             raise PermissionError("Must run as root to load the data")
         plt.clf()
-        chunk_loc = f"/mnt/ssd-cluster/single_chunks_gpt2sm/l{layer}_{layer_loc}/0.pt"
-        activations = torch.load(chunk_loc).to(torch.float32).to(device)
+        chunk_folder = f"/mnt/ssd-cluster/single_chunks_gpt2sm/l{layer}_{layer_loc}"
+        activations = load_activation_chunk(chunk_folder, 0).to(torch.float32).to(device)
         layer_data: List[Tuple[int, List[Tuple[float, float]]]] = []
         for ratio in ratios:
             dicts_loc = f"{tied}_{layer_loc}_l{layer}_r{ratio}"
@@ -72,13 +74,8 @@ def run_for_layer(args) -> None:
 
         # save the data
         os.makedirs(PLOT_DATA_DIR, exist_ok=True)
-        pickle.dump(
-            layer_data,
-            open(
-                os.path.join(PLOT_DATA_DIR, f"n_active_gpt2sm_{tied}_l{layer}_{layer_loc}_nc{n_chunks}.pkl"),
-                "wb",
-            ),
-        )
+        with open(os.path.join(PLOT_DATA_DIR, f"n_active_gpt2sm_{tied}_l{layer}_{layer_loc}_nc{n_chunks}.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+            pickle.dump(layer_data, f, protocol=pickle.HIGHEST_PROTOCOL)
         print(f"Finished layer {layer} {layer_loc}")
 
     else:
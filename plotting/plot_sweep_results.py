@@ -17,6 +17,8 @@ from matplotlib.markers import MarkerStyle
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import standard_metrics
+from config import PICKLE_BUFFER_SIZE
+from activation_dataset import load_activation_chunk
 from autoencoders.learned_dict import LearnedDict
 from autoencoders.pca import BatchedPCA, PCAEncoder
 
@@ -106,7 +108,7 @@ def plot_by_group() -> None:
         chunk_name = "_".join(graph_name.split("_")[:2])
         print(f"Found {sum(len(x) for x in learned_dicts_nested)} lists of dicts for experiment {graph_name}")
 
-        dataset = torch.load(f"/mnt/ssd-cluster/single_chunks/{chunk_name}/0.pt")
+        dataset = load_activation_chunk(f"/mnt/ssd-cluster/single_chunks/{chunk_name}", 0)
         sample_idxs = np.random.choice(len(dataset), 5000, replace=False)
 
         device = torch.device("cuda:0")
@@ -126,7 +128,8 @@ def plot_by_group() -> None:
                 datapoint_series.append((run_name, datapoints))
             all_data.append(datapoint_series)
 
-        pickle.dump(plot_dir, open(f"all_data_{graph_name}.pkl", "wb"))
+        with open(f"all_data_{graph_name}.pkl", "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+            pickle.dump(plot_dir, f, protocol=pickle.HIGHEST_PROTOCOL)
 
         colors = [
             "Purples",
@@ -234,7 +237,7 @@ def plot_fuv_sparsity():
 
     device = torch.device("cuda:7")
 
-    dataset = torch.load("activation_data_synthetic/0.pt").to(dtype=torch.float32, device=device)
+    dataset = load_activation_chunk("activation_data_synthetic", 0).to(dtype=torch.float32, device=device)
 
     pca = BatchedPCA(dataset.shape[1], device)
 
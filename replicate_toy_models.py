@@ -22,10 +22,14 @@ from matplotlib import pyplot as plt
 from torchtyping import TensorType
 from tqdm import tqdm
 
-from config import ToyArgs
+from config import PICKLE_BUFFER_SIZE, ToyArgs
+from sc_datasets.random_dataset import generate_corr_matrix, generate_rand_feats
 
 n_ground_truth_components, activation_dim, dataset_size = None, None, None
 
+# Upper bound on n_models * n_dict_components for a single BatchedAutoEncoder in the sweep
+MAX_BATCHED_DICT_COMPONENTS = 2**16
+
 
 @dataclass
 class RandomDatasetGenerator(Generator):
@@ -36,6 +40,8 @@ class RandomDatasetGenerator(Generator):
     feature_prob_decay: float
     correlated: bool
     device: Union[torch.device, str]
+    pool_size: int = 8  # number of batches of masks and strengths drawn at once (non-correlated only)
+    seed: Optional[int] = None  # if given, features and correlations are drawn from it and cached in data/
 
     frac_nonzero: float = field(init=False)
     decay: TensorType["n_ground_truth_components"] = field(init=False)
@@ -52,15 +58,48 @@ class RandomDatasetGenerator(Generator):
         )  # FIXME: 1 / i
 
         if self.correlated:
-            self.corr_matrix = generate_corr_matrix(self.n_ground_truth_components, device=self.device)
+            self.corr_matrix = generate_corr_matrix(self.n_ground_truth_components, device=self.device, seed=self.seed)
+            # built once, so each batch doesn't redo the Cholesky factorization of corr_matrix
+            self._mvn = torch.distributions.MultivariateNormal(
+                loc=torch.zeros(self.n_ground_truth_components, device=self.device),
+                covariance_matrix=self.corr_matrix,
+            )
         else:
             self.component_probs = self.decay * self.frac_nonzero  # Only if non-correlated
         self.feats = generate_rand_feats(
             self.activation_dim,
             self.n_ground_truth_components,
             device=self.device,
+            seed=self.seed,
         )
 
+        if not self.correlated:
+            # preallocated pools of masks and strengths, refilled in place every pool_size batches
+            pool_shape = (self.pool_size, self.batch_size, self.n_ground_truth_components)
+            self._mask_pool = torch.empty(pool_shape, device=self.device)
+            self._strength_pool = torch.empty(pool_shape, device=self.device)
+            self._refill()
+
+    def __getstate__(self):
+        # the sampling pools are scratch space (pool_size full batches), so leave them out of data_generator.pkl
+        state = self.__dict__.copy()
+        state.pop("_mask_pool", None)
+        state.pop("_strength_pool", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not self.correlated:
+            pool_shape = (self.pool_size, self.batch_size, self.n_ground_truth_components)
+            self._mask_pool = torch.empty(pool_shape, device=self.feats.device)
+            self._strength_pool = torch.empty(pool_shape, device=self.feats.device)
+            self._refill()
+
+    def _refill(self) -> None:
+        self._mask_pool.bernoulli_(self.component_probs)
+        self._strength_pool.uniform_()
+        self._idx = 0
+
     def send(self, ignored_arg: Any) -> TensorType["dataset_size", "activation_dim"]:
         if self.correlated:
             _, _, data = generate_correlated_dataset(
@@ -71,15 +110,14 @@ class RandomDatasetGenerator(Generator):
                 self.frac_nonzero,
                 self.decay,
                 self.device,
+                mvn=self._mvn,
             )
         else:
-            _, _, data = generate_rand_dataset(
-                self.n_ground_truth_components,
-                self.batch_size,
-                self.component_probs,
-                self.feats,
-                self.device,
-            )
+            # each pool slot is used once, so its strengths can be masked in place
+            data = self._strength_pool[self._idx].mul_(self._mask_pool[self._idx]) @ self.feats
+            self._idx += 1
+            if self._idx == self.pool_size:
+                self._refill()
         return data
 
     def throw(self, type: Any = None, value: Any = None, traceback: Any = None) -> None:
@@ -97,17 +135,10 @@ def generate_rand_dataset(
     TensorType["dataset_size", "n_ground_truth_components"],
     TensorType["dataset_size", "activation_dim"],
 ]:
-    # generate random feature strengths
-    feature_strengths = torch.rand((dataset_size, n_ground_truth_components), device=device)
-    # only some features are activated, chosen at random
-    dataset_thresh = torch.rand(dataset_size, n_ground_truth_components, device=device)
-    data_zero = torch.zeros_like(dataset_thresh, device=device)
-
-    dataset_codes = torch.where(
-        dataset_thresh <= feature_probs,
-        feature_strengths,
-        data_zero,
-    )  # dim: dataset_size x n_ground_truth_components
+    # only some features are activated, chosen at random: sample the float mask directly with bernoulli,
+    # then scale it in place by random feature strengths
+    dataset_codes = torch.bernoulli(feature_probs.expand(dataset_size, n_ground_truth_components))
+    dataset_codes.mul_(torch.rand_like(dataset_codes))  # dim: dataset_size x n_ground_truth_components
 
     dataset = dataset_codes @ feats
 
@@ -122,16 +153,18 @@ def generate_correlated_dataset(
     frac_nonzero: float,
     decay: TensorType["n_ground_truth_components"],
     device: Union[torch.device, str],
+    mvn: Optional[torch.distributions.MultivariateNormal] = None,
 ) -> Tuple[
     TensorType["n_ground_truth_components", "activation_dim"],
     TensorType["dataset_size", "n_ground_truth_components"],
     TensorType["dataset_size", "activation_dim"],
 ]:
     # Get a correlated gaussian sample
-    mvn = torch.distributions.MultivariateNormal(
-        loc=torch.zeros(n_ground_truth_components, device=device),
-        covariance_matrix=corr_matrix,
-    )
+    if mvn is None:
+        mvn = torch.distributions.MultivariateNormal(
+            loc=torch.zeros(n_ground_truth_components, device=device),
+            covariance_matrix=corr_matrix,
+        )
     corr_thresh = mvn.sample()
 
     # Take the CDF of that sample.
@@ -149,14 +182,9 @@ def generate_correlated_dataset(
 
     # generate random feature strengths
     feature_strengths = torch.rand((dataset_size, n_ground_truth_components), device=device)
-    data_zero = torch.zeros_like(corr_thresh, device=device)
     # only some features are activated, chosen at random
     dataset_thresh = torch.rand(dataset_size, n_ground_truth_components, device=device)
-    dataset_codes = torch.where(
-        dataset_thresh <= component_probs,
-        feature_strengths,
-        data_zero,
-    )
+    dataset_codes = feature_strengths.mul_(dataset_thresh <= component_probs)
     # Ensure there are no datapoints w/ 0 features
     zero_sample_index = (dataset_codes.count_nonzero(dim=1) == 0).nonzero()[:, 0]
     random_index = torch.randint(low=0, high=n_ground_truth_components, size=(zero_sample_index.shape[0],)).to(
@@ -170,60 +198,40 @@ def generate_correlated_dataset(
     return feats, dataset_codes, dataset
 
 
-def generate_rand_feats(
-    feat_dim: int,
-    num_feats: int,
-    device: Union[torch.device, str],
-) -> TensorType["n_ground_truth_components", "activation_dim"]:
-    data_path = os.path.join(os.getcwd(), "data")
-    data_filename = os.path.join(data_path, f"feats_{feat_dim}_{num_feats}.npy")
-
-    feats = np.random.multivariate_normal(np.zeros(feat_dim), np.eye(feat_dim), size=num_feats)
-    feats = feats.T / np.linalg.norm(feats, axis=1)
-    feats = feats.T
-
-    feats_tensor = torch.from_numpy(feats).to(device).float()
-    return feats_tensor
-
-
-def generate_corr_matrix(
-    num_feats: int, device: Union[torch.device, str]
-) -> TensorType["n_ground_truth_components", "n_ground_truth_components"]:
-    corr_mat_path = os.path.join(os.getcwd(), "data")
-    corr_mat_filename = os.path.join(corr_mat_path, f"corr_mat_{num_feats}.npy")
-
-    # Create a correlation matrix
-    corr_matrix = np.random.rand(num_feats, num_feats)
-    corr_matrix = (corr_matrix + corr_matrix.T) / 2
-    min_eig = np.min(np.real(np.linalg.eigvals(corr_matrix)))
-    if min_eig < 0:
-        corr_matrix -= 1.001 * min_eig * np.eye(corr_matrix.shape[0], corr_matrix.shape[1])
-
-    corr_matrix_tensor = torch.from_numpy(corr_matrix).to(device).float()
-
-    return corr_matrix_tensor
+# AutoEncoder Definition
+def orthogonal_decoder_init(activation_size, n_dict_components):
+    """An orthogonally initialised decoder weight, shape (activation_size, n_dict_components), to share between models"""
+    weight = torch.empty(activation_size, n_dict_components)
+    nn.init.orthogonal_(weight)
+    return weight
 
 
-# AutoEncoder Definition
 class AutoEncoder(nn.Module):
-    def __init__(self, activation_size, n_dict_components):
+    def __init__(self, activation_size, n_dict_components, init_decoder=None):
         super(AutoEncoder, self).__init__()
 
         self.encoder = nn.Sequential(nn.Linear(activation_size, n_dict_components), nn.ReLU())
         self.decoder = nn.Linear(n_dict_components, activation_size, bias=False)
 
-        # Initialize the decoder weights orthogonally
-        nn.init.orthogonal_(self.decoder.weight)
+        # Initialize the decoder weights orthogonally, unless given a (precomputed) initialisation
+        if init_decoder is None:
+            nn.init.orthogonal_(self.decoder.weight)
+        else:
+            self.decoder.weight.data.copy_(init_decoder)
+        self.normalize_decoder()
 
     def forward(self, x):
         c = self.encoder(x)
-
-        # Apply unit norm constraint to the decoder weights
-        self.decoder.weight.data = nn.functional.normalize(self.decoder.weight.data, dim=0)
-
         x_hat = self.decoder(c)
         return x_hat, c
 
+    @torch.no_grad()
+    def normalize_decoder(self):
+        # Apply unit norm constraint to the decoder weights, in place. Called after each optimizer step
+        # rather than in forward, so inference (e.g. get_n_dead_neurons) doesn't rewrite the weights
+        weight = self.decoder.weight.data
+        weight.div_(weight.norm(dim=0, keepdim=True).clamp_min(1e-8))
+
     @property
     def device(self):
         return next(self.parameters()).device
@@ -232,43 +240,44 @@ class AutoEncoder(nn.Module):
 def cosine_sim(
     vecs1: Union[torch.Tensor, torch.nn.parameter.Parameter, npt.NDArray],
     vecs2: Union[torch.Tensor, torch.nn.parameter.Parameter, npt.NDArray],
-) -> np.ndarray:
-    vecs = [vecs1, vecs2]
-    for i in range(len(vecs)):
-        if not isinstance(vecs[i], np.ndarray):
-            vecs[i] = vecs[i].detach().cpu().numpy()  # type: ignore
-    vecs1, vecs2 = vecs
-    normalize = lambda v: (v.T / np.linalg.norm(v, axis=1)).T
-    vecs1_norm = normalize(vecs1)
-    vecs2_norm = normalize(vecs2)
+) -> torch.Tensor:
+    # Computed with torch on vecs1's device, so GPU weights don't need a round trip through numpy
+    vecs1 = torch.as_tensor(vecs1).detach()
+    vecs2 = torch.as_tensor(vecs2).detach().to(device=vecs1.device, dtype=vecs1.dtype)
+    vecs1_norm = nn.functional.normalize(vecs1, dim=1)
+    vecs2_norm = nn.functional.normalize(vecs2, dim=1)
 
     return vecs1_norm @ vecs2_norm.T
 
 
-def mean_max_cosine_similarity(ground_truth_features, learned_dictionary, debug=False):
+def mean_max_cosine_similarity(ground_truth_features, learned_dictionary, debug=False) -> float:
     # Calculate cosine similarity between all pairs of ground truth and learned features
     cos_sim = cosine_sim(ground_truth_features, learned_dictionary)
     # Find the maximum cosine similarity for each ground truth feature, then average
-    mmcs = cos_sim.max(axis=1).mean()
+    mmcs = cos_sim.max(dim=1).values.mean().item()
     return mmcs
 
 
 def get_n_dead_neurons(auto_encoder, data_generator, n_batches=10):
     """
     :param result_dict: dictionary containing the results of a single run
-    :return: number of dead neurons
+    :return: number of dead neurons (a list with one count per model for a BatchedAutoEncoder)
 
     Estimates the number of dead neurons in the network by running a few batches of data through the network and
     calculating the mean activation of each neuron. If the mean activation is 0 for a neuron, it is considered dead.
     """
-    outputs = []
-    for i in range(n_batches):
-        batch = next(data_generator)
-        x_hat, c = auto_encoder(batch)  # x_hat: (batch_size, activation_dim), c: (batch_size, n_dict_components)
-        outputs.append(c)
-    outputs = torch.cat(outputs)  # (n_batches * batch_size, n_dict_components)
-    mean_activations = outputs.mean(dim=0)  # (n_dict_components), c is after the ReLU, no need to take abs
-    n_dead_neurons = (mean_activations == 0).sum().item()
+    # c is after the ReLU, so a neuron's mean activation is 0 iff its summed activation is 0: keep a running sum
+    # rather than concatenating every batch's activations
+    activation_sums = None  # ([n_models,] n_dict_components)
+    with torch.inference_mode():
+        for i in range(n_batches):
+            batch = next(data_generator)
+            x_hat, c = auto_encoder(batch)  # x_hat: ([n_models,] batch_size, activation_dim), c: ([n_models,] batch_size, n_dict_components)
+            if activation_sums is None:
+                activation_sums = c.sum(dim=-2)
+            else:
+                activation_sums.add_(c.sum(dim=-2))
+    n_dead_neurons = (activation_sums == 0).sum(dim=-1).tolist()
     return n_dead_neurons
 
 
@@ -276,7 +285,112 @@ def analyse_result(result):
     get_n_dead_neurons(result)
 
 
-def run_single_go(cfg: ToyArgs, data_generator: Optional[RandomDatasetGenerator]):
+class CUDAPrefetcher:
+    """
+    Wraps a data generator so that, on CUDA, the next batch is generated on a side stream and overlaps with the
+    training step on the current one. On CPU it just forwards to the generator.
+    """
+
+    def __init__(self, data_generator, device):
+        self.data_generator = data_generator
+        self.stream = torch.cuda.Stream(device=device) if device.type == "cuda" else None
+        self.preload()
+
+    def preload(self):
+        if self.stream is None:
+            self.batch = next(self.data_generator)
+            return
+        # don't start until the work already queued on the main stream (e.g. generator setup) is done
+        self.stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self.stream):
+            self.batch = next(self.data_generator)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.stream is not None:
+            torch.cuda.current_stream().wait_stream(self.stream)
+            # the batch is consumed on the main stream, so its memory mustn't be reused by the side stream early
+            self.batch.record_stream(torch.cuda.current_stream())
+        batch = self.batch
+        self.preload()
+        return batch
+
+
+class BatchedAutoEncoder(nn.Module):
+    """
+    n_models independent AutoEncoders of the same size, stacked so that a whole row of the l1_alpha sweep is trained
+    in a single forward and backward pass. The loss is the sum of the per-model losses, so each model receives exactly
+    the gradient it would get if trained alone (and Adam is elementwise, so the optimizer state is also independent).
+    """
+
+    def __init__(self, n_models, activation_size, n_dict_components, init_decoder=None):
+        super(BatchedAutoEncoder, self).__init__()
+
+        # Initialize each model exactly as a single AutoEncoder would be, then stack
+        auto_encoders = [AutoEncoder(activation_size, n_dict_components, init_decoder) for _ in range(n_models)]
+        # (n_models, activation_size, n_dict_components)
+        self.encoder_weight = nn.Parameter(torch.stack([ae.encoder[0].weight.data.t() for ae in auto_encoders]))
+        # (n_models, n_dict_components)
+        self.encoder_bias = nn.Parameter(torch.stack([ae.encoder[0].bias.data for ae in auto_encoders]))
+        # (n_models, n_dict_components, activation_size), one dictionary element per row
+        self.decoder_weight = nn.Parameter(torch.stack([ae.decoder.weight.data.t() for ae in auto_encoders]))
+
+    def forward(self, x):
+        c = nn.functional.relu(torch.einsum("bd,ldn->lbn", x, self.encoder_weight) + self.encoder_bias[:, None, :])
+        x_hat = torch.einsum("lbn,lnd->lbd", c, self.decoder_weight)
+        return x_hat, c
+
+    @torch.no_grad()
+    def normalize_decoder(self):
+        weight = self.decoder_weight.data
+        weight.div_(weight.norm(dim=-1, keepdim=True).clamp_min(1e-8))
+
+    def unstack(self, device=None) -> List[AutoEncoder]:
+        device = self.device if device is None else device
+        n_models, n_dict_components, activation_size = self.decoder_weight.shape
+        auto_encoders = []
+        for i in range(n_models):
+            # passing the trained decoder as init_decoder skips a wasted orthogonal (QR) initialisation
+            auto_encoder = AutoEncoder(activation_size, n_dict_components, self.decoder_weight.data[i].t())
+            with torch.no_grad():
+                auto_encoder.encoder[0].weight.copy_(self.encoder_weight[i].t())
+                auto_encoder.encoder[0].bias.copy_(self.encoder_bias[i])
+            auto_encoders.append(auto_encoder.to(device))
+        return auto_encoders
+
+    @property
+    def device(self):
+        return next(self.parameters()).device
+
+
+def batched_loss(auto_encoder: BatchedAutoEncoder, batch, l1_alphas, mixed_precision=False):
+    """Per-model reconstruction and L1 losses for a BatchedAutoEncoder, each of shape (n_models,)"""
+    # With mixed_precision, the forward pass runs in bf16 on GPU; params, Adam state and the decoder normalization
+    # stay in fp32. Off by default, since the bf16 forward pass perturbs the losses and learned dictionaries
+    autocast_enabled = mixed_precision and batch.device.type == "cuda"
+    with torch.autocast(device_type=batch.device.type, dtype=torch.bfloat16, enabled=autocast_enabled):
+        x_hat, c = auto_encoder(batch)
+
+        l_reconstruction = (x_hat.float() - batch).pow(2).mean(dim=(1, 2))
+        # abs().sum() rather than torch.norm(c, 1) lets Inductor fuse the L1 term into the reduction
+        l_l1 = l1_alphas * c.float().abs().sum(dim=-1).mean(dim=-1) / c.size(-1)
+        # l_l1 = l1_alpha * torch.norm(c,1, dim=1).sum() / c.size(1)
+    return l_reconstruction, l_l1
+
+
+def run_batched_go(
+    cfg: ToyArgs,
+    l1_alphas: List[float],
+    data_generator: Optional[RandomDatasetGenerator],
+    init_decoder: Optional[torch.Tensor] = None,
+):
+    """
+    Trains one autoencoder with cfg.n_components_dictionary components for each of l1_alphas, all at once.
+    If given, init_decoder (see orthogonal_decoder_init) is used as every model's initial decoder weight.
+    Returns a list with one (mmcs, auto_encoder, n_dead_neurons, running_recon_loss) tuple per l1_alpha.
+    """
     device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
     if not data_generator:
@@ -288,69 +402,92 @@ def run_single_go(cfg: ToyArgs, data_generator: Optional[RandomDatasetGenerator]
             feature_prob_decay=cfg.feature_prob_decay,
             correlated=cfg.correlated_components,
             device=device,
+            seed=cfg.seed,
         )
 
-    auto_encoder = AutoEncoder(cfg.activation_dim, cfg.n_components_dictionary).to(device)
+    auto_encoder = BatchedAutoEncoder(
+        len(l1_alphas), cfg.activation_dim, cfg.n_components_dictionary, init_decoder=init_decoder
+    ).to(device)
+    l1_alphas_tensor = torch.tensor(l1_alphas, dtype=torch.float32, device=device)
+    # fuse the forward pass and losses into a few kernels on GPU; the decoder normalization stays outside the graph
+    loss_fn = torch.compile(batched_loss, mode="reduce-overhead") if device.type == "cuda" else batched_loss
 
-    ground_truth_features = data_generator.feats
+    ground_truth_features = data_generator.feats.to(device)
     # Train the model
     optimizer = optim.Adam(auto_encoder.parameters(), lr=cfg.lr)
 
-    # Hold a running average of the reconstruction loss
-    running_recon_loss = 0.0
+    # Hold a running average of the reconstruction loss of each model, on device so that updating it doesn't sync
+    running_recon_loss = torch.zeros(len(l1_alphas), device=device)
     time_horizon = 1000
+    # Reused every step for the input noise, rather than allocating with randn_like
+    noise_buf = torch.empty(cfg.batch_size, cfg.activation_dim, device=device)
+    # Generate each batch on a side stream while the previous step trains
+    prefetcher = CUDAPrefetcher(data_generator, device)
     for epoch in range(cfg.epochs):
-        epoch_loss = 0.0
+        epoch_loss = torch.zeros((), device=device)
 
         # for batch_index in range(dataset_size // batch_size):
         # Generate a batch of samples
         # batch = final_dataset[batch_index*batch_size:(batch_index+1)*batch_size].to(device)
         # batch = create_dataset(ground_truth_features, probabilities, batch_size).float().to(device)
-        batch = next(data_generator)
-        batch = batch + cfg.noise_level * torch.randn_like(batch)
+        batch = next(prefetcher)
+        if cfg.noise_level:
+            noise_buf.normal_()
+            batch.add_(noise_buf, alpha=cfg.noise_level)
 
         optimizer.zero_grad()
 
-        # Forward pass
-        x_hat, c = auto_encoder(batch)
-
-        # Compute the reconstruction loss and L1 regularization
-        l_reconstruction = torch.nn.MSELoss()(batch, x_hat)
-        l_l1 = cfg.l1_alpha * torch.norm(c, 1, dim=1).mean() / c.size(1)
-        # l_l1 = l1_alpha * torch.norm(c,1, dim=1).sum() / c.size(1)
+        # Forward pass, reconstruction loss and L1 regularization of each model
+        l_reconstruction, l_l1 = loss_fn(auto_encoder, batch, l1_alphas_tensor, cfg.mixed_precision)
 
         # Compute the total loss
-        loss = l_reconstruction + l_l1
+        loss = (l_reconstruction + l_l1).sum()
 
         # Backward pass
         loss.backward()
 
         optimizer.step()
+        auto_encoder.normalize_decoder()
 
         # Add the loss for this batch to the total loss for this epoch
-        epoch_loss += loss.item()
-        running_recon_loss *= (time_horizon - 1) / time_horizon
-        running_recon_loss += l_reconstruction.item() / time_horizon
+        epoch_loss += loss.detach()
+        running_recon_loss.mul_((time_horizon - 1) / time_horizon).add_(
+            l_reconstruction.detach(), alpha=1 / time_horizon
+        )
 
         if (epoch + 1) % 1000 == 0:
             # Calculate MMCS
-            learned_dictionary = auto_encoder.decoder.weight.data.t()
-            mmcs = mean_max_cosine_similarity(ground_truth_features.to(auto_encoder.device), learned_dictionary)
-            print(f"Mean Max Cosine Similarity: {mmcs:.3f}")
+            for i, learned_dictionary in enumerate(auto_encoder.decoder_weight.data):
+                mmcs = mean_max_cosine_similarity(ground_truth_features, learned_dictionary)
+                print(f"l1_alpha: {l1_alphas[i]} | Mean Max Cosine Similarity: {mmcs:.3f}")
 
             # Compute the average loss for this epoch
             # epoch_loss /= (dataset_size // batch_size)
             # debug_sparsity_of_c(auto_encoder, ground_truth_features, probabilities, batch_size)
 
             if True:
-                print(f"Epoch {epoch+1}/{cfg.epochs}: Reconstruction = {l_reconstruction:.6f} | l1: {l_l1:.6f}")
+                # one transfer for all models rather than an .item() per printed value
+                recon_losses, l1_losses = torch.stack([l_reconstruction, l_l1]).tolist()
+                for i in range(len(l1_alphas)):
+                    print(
+                        f"Epoch {epoch+1}/{cfg.epochs}: l1_alpha: {l1_alphas[i]} | Reconstruction = {recon_losses[i]:.6f} | l1: {l1_losses[i]:.6f}"
+                    )
 
     # debug_sparsity_of_c(auto_encoder, ground_truth_features, probabilities, batch_size)
 
-    learned_dictionary = auto_encoder.decoder.weight.data.t()
-    mmcs = mean_max_cosine_similarity(ground_truth_features.to(auto_encoder.device), learned_dictionary)
     n_dead_neurons = get_n_dead_neurons(auto_encoder, data_generator)
-    return mmcs, auto_encoder, n_dead_neurons, running_recon_loss
+    running_recon_loss = running_recon_loss.tolist()
+    results = []
+    # score against the ground truth on device, then build the returned AutoEncoders directly on the CPU
+    for i, single_auto_encoder in enumerate(auto_encoder.unstack(device="cpu")):
+        learned_dictionary = auto_encoder.decoder_weight.data[i]
+        mmcs = mean_max_cosine_similarity(ground_truth_features, learned_dictionary)
+        results.append((mmcs, single_auto_encoder, n_dead_neurons[i], running_recon_loss[i]))
+    return results
+
+
+def run_single_go(cfg: ToyArgs, data_generator: Optional[RandomDatasetGenerator]):
+    return run_batched_go(cfg, [cfg.l1_alpha], data_generator)[0]
 
 
 def plot_mat(
@@ -408,12 +545,10 @@ def compare_mmcs_with_larger_dicts(dict: npt.NDArray, larger_dicts: List[npt.NDA
     n_larger_dicts = len(larger_dicts)
     n_elements = dict.shape[0]
     max_cosine_similarities = np.zeros((n_elements, n_larger_dicts))
-    for elem_ndx in range(n_elements):
-        element = np.expand_dims(dict[elem_ndx], 0)
-        for dict_ndx, larger_dict in enumerate(larger_dicts):
-            cosine_sims = cosine_sim(element, larger_dict).squeeze()
-            max_cosine_similarity = max(cosine_sims)
-            max_cosine_similarities[elem_ndx, dict_ndx] = max_cosine_similarity
+    # one (n_elements, n_larger_elements) matmul per larger dict, rather than one per element
+    for dict_ndx, larger_dict in enumerate(larger_dicts):
+        cosine_sims = cosine_sim(dict, larger_dict)
+        max_cosine_similarities[:, dict_ndx] = cosine_sims.max(dim=1).values.cpu().numpy()
     mean_max_cosine_similarity = max_cosine_similarities.mean()
     return mean_max_cosine_similarity
 
@@ -450,6 +585,11 @@ def main():
     torch.manual_seed(cfg.seed)
     np.random.seed(cfg.seed)
 
+    if cfg.mixed_precision:
+        # Allow TF32 tensor cores for any fp32 matmuls left outside of autocast
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+
     l1_range = [10 ** (exp / 4) for exp in range(cfg.l1_exp_low, cfg.l1_exp_high)]  # replicate is (-8,9)
     learned_dict_ratios = [2**exp for exp in range(cfg.dict_ratio_exp_low, cfg.dict_ratio_exp_high)]  # replicate is (-2,6)
     print("Range of l1 values being used: ", l1_range)
@@ -469,28 +609,47 @@ def main():
         feature_prob_decay=cfg.feature_prob_decay,
         correlated=cfg.correlated_components,
         device=device,
+        seed=cfg.seed,
     )
 
     # 2D array of learned dictionaries, indexed by l1_alpha and learned_dict_ratio, start with Nones
     auto_encoders = [[None for _ in range(len(learned_dict_ratios))] for _ in range(len(l1_range))]
     learned_dicts = [[None for _ in range(len(learned_dict_ratios))] for _ in range(len(l1_range))]
 
-    for l1_alpha, learned_dict_ratio in tqdm(list(itertools.product(l1_range, learned_dict_ratios))):
-        cfg.l1_alpha = l1_alpha
+    # Train every l1_alpha for a given dict size together, in groups small enough to fit in memory.
+    # With share_decoder_init, every model of a given size starts from the same decoder. Off by default, so the
+    # l1_alphas of a row start from independent inits
+    sweep_rows = []
+    init_decoders = {}
+    for learned_dict_ratio in learned_dict_ratios:
+        n_components_dictionary = int(cfg.n_ground_truth_components * learned_dict_ratio)
+        if cfg.share_decoder_init:
+            init_decoders[learned_dict_ratio] = orthogonal_decoder_init(cfg.activation_dim, n_components_dictionary)
+        l1s_per_go = max(1, MAX_BATCHED_DICT_COMPONENTS // n_components_dictionary)
+        for i in range(0, len(l1_range), l1s_per_go):
+            sweep_rows.append((learned_dict_ratio, l1_range[i : i + l1s_per_go]))
+
+    for row_ndx, (learned_dict_ratio, l1_alphas) in enumerate(tqdm(sweep_rows)):
+        # AutoEncoders are only built inside run_batched_go, so a row's models never coexist with the previous
+        # row's. Release the cached blocks sized for the last dict size before allocating for the next one
+        if row_ndx > 0 and learned_dict_ratio != sweep_rows[row_ndx - 1][0] and device.type == "cuda":
+            torch.cuda.empty_cache()
         cfg.learned_dict_ratio = learned_dict_ratio
         cfg.n_components_dictionary = int(cfg.n_ground_truth_components * cfg.learned_dict_ratio)
-        mmcs, auto_encoder, n_dead_neurons, reconstruction_loss = run_single_go(cfg, data_generator)
-        print(
-            f"l1_alpha: {l1_alpha} | learned_dict_ratio: {learned_dict_ratio} | mmcs: {mmcs:.3f} | n_dead_neurons: {n_dead_neurons} | reconstruction_loss: {reconstruction_loss:.3f}"
-        )
+        results = run_batched_go(cfg, l1_alphas, data_generator, init_decoder=init_decoders.get(learned_dict_ratio))
+        for l1_alpha, (mmcs, auto_encoder, n_dead_neurons, reconstruction_loss) in zip(l1_alphas, results):
+            cfg.l1_alpha = l1_alpha
+            print(
+                f"l1_alpha: {l1_alpha} | learned_dict_ratio: {learned_dict_ratio} | mmcs: {mmcs:.3f} | n_dead_neurons: {n_dead_neurons} | reconstruction_loss: {reconstruction_loss:.3f}"
+            )
 
-        mmcs_matrix[l1_range.index(l1_alpha), learned_dict_ratios.index(learned_dict_ratio)] = mmcs
-        dead_neurons_matrix[l1_range.index(l1_alpha), learned_dict_ratios.index(learned_dict_ratio)] = n_dead_neurons
-        recon_loss_matrix[l1_range.index(l1_alpha), learned_dict_ratios.index(learned_dict_ratio)] = reconstruction_loss
-        auto_encoders[l1_range.index(l1_alpha)][learned_dict_ratios.index(learned_dict_ratio)] = auto_encoder.cpu()
-        learned_dicts[l1_range.index(l1_alpha)][learned_dict_ratios.index(learned_dict_ratio)] = (
-            auto_encoder.decoder.weight.detach().cpu().data.t()
-        )
+            mmcs_matrix[l1_range.index(l1_alpha), learned_dict_ratios.index(learned_dict_ratio)] = mmcs
+            dead_neurons_matrix[l1_range.index(l1_alpha), learned_dict_ratios.index(learned_dict_ratio)] = n_dead_neurons
+            recon_loss_matrix[l1_range.index(l1_alpha), learned_dict_ratios.index(learned_dict_ratio)] = reconstruction_loss
+            auto_encoders[l1_range.index(l1_alpha)][learned_dict_ratios.index(learned_dict_ratio)] = auto_encoder
+            learned_dicts[l1_range.index(l1_alpha)][learned_dict_ratios.index(learned_dict_ratio)] = (
+                auto_encoder.decoder.weight.detach().t()
+            )
 
     outputs_folder = "outputs"
     current_time = datetime.now().strftime("%Y%m%d-%H%M%S")
@@ -527,28 +686,31 @@ def main():
         title="Reconstruction Loss",
         save_name="recon_loss_matrix.png",
     )
-    with open(os.path.join(outputs_folder, "auto_encoders.pkl"), "wb") as f:
-        pickle.dump(auto_encoders, f)
-    with open(os.path.join(outputs_folder, "data_generator.pkl"), "wb") as f:
-        pickle.dump(data_generator, f)
-    with open(os.path.join(outputs_folder, "config.pkl"), "wb") as f:
-        pickle.dump(cfg, f)
+    np.savez_compressed(
+        os.path.join(outputs_folder, "results.npz"),
+        mmcs=mmcs_matrix,
+        dead_neurons=dead_neurons_matrix,
+        recon_loss=recon_loss_matrix,
+        l1_range=np.array(l1_range),
+        learned_dict_ratios=np.array(learned_dict_ratios),
+    )
+    with open(os.path.join(outputs_folder, "auto_encoders.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+        pickle.dump(auto_encoders, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(outputs_folder, "data_generator.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+        pickle.dump(data_generator, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(outputs_folder, "config.pkl"), "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+        pickle.dump(cfg, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     # Compare each learned dictionary to the larger ones
     av_mmcs_with_larger_dicts = np.zeros((len(l1_range), len(learned_dict_ratios)))
     for l1_ndx, dict_size_ndx in tqdm(list(itertools.product(range(len(l1_range)), range(len(learned_dict_ratios))))):
         if dict_size_ndx == len(learned_dict_ratios) - 1:
             continue
-        smaller_dict = learned_dicts[l1_ndx][dict_size_ndx]
-        larger_dict = learned_dicts[l1_ndx][dict_size_ndx + 1]
-        smaller_dict_features, shared_vector_size = smaller_dict.shape
-
-        max_cosine_similarities = np.zeros((smaller_dict_features))
-        for i, vector in enumerate(smaller_dict):
-            max_cosine_similarities[i] = torch.nn.functional.cosine_similarity(
-                vector.to(cfg.device), larger_dict.to(cfg.device), dim=1
-            ).max()
-        av_mmcs_with_larger_dicts[l1_ndx, dict_size_ndx] = max_cosine_similarities.mean().item()
+        # move each pair to the device once and compare all rows together, rather than copying
+        # the larger dict over again for every row of the smaller one
+        smaller_dict = learned_dicts[l1_ndx][dict_size_ndx].to(cfg.device)
+        larger_dict = learned_dicts[l1_ndx][dict_size_ndx + 1].to(cfg.device)
+        av_mmcs_with_larger_dicts[l1_ndx, dict_size_ndx] = compare_mmcs_with_larger_dicts(smaller_dict, [larger_dict])
 
     plot_mat(
         av_mmcs_with_larger_dicts,
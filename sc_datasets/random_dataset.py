@@ -1,3 +1,4 @@
+import math
 import os
 from dataclasses import dataclass, field
 from typing import Any, Generator, Optional, Tuple, Union
@@ -22,6 +23,8 @@ class RandomDatasetGenerator(Generator):
     feature_prob_decay: float
     correlated: bool
     device: Union[torch.device, str]
+    pool_size: int = 8  # number of batches of uniform samples drawn at once (non-correlated only)
+    seed: Optional[int] = None  # if given, features and correlations are drawn from it and cached in data/
 
     frac_nonzero: float = field(init=False)
     decay: TensorType["n_ground_truth_components"] = field(init=False)
@@ -38,16 +41,32 @@ class RandomDatasetGenerator(Generator):
         )  # FIXME: 1 / i
 
         if self.correlated:
-            self.corr_matrix = generate_corr_matrix(self.n_ground_truth_components, device=self.device)
+            self.corr_matrix = generate_corr_matrix(self.n_ground_truth_components, device=self.device, seed=self.seed)
+            self._mvn = make_mvn(self.corr_matrix)
         else:
             self.component_probs = self.decay * self.frac_nonzero  # Only if non-correlated
         self.feats = generate_rand_feats(
             self.activation_dim,
             self.n_ground_truth_components,
             device=self.device,
+            seed=self.seed,
         )
         self.t_type = torch.float32
 
+        if not self.correlated:
+            # preallocated pools of thresholds, values and strengths, refilled in place every pool_size batches
+            pool_shape = (self.pool_size, self.batch_size, self.n_ground_truth_components)
+            self._thresh_pool = torch.empty(pool_shape, device=self.device)
+            self._value_pool = torch.empty(pool_shape, device=self.device)
+            self._strength_pool = torch.empty(pool_shape, device=self.device)
+            self._refill()
+
+    def _refill(self) -> None:
+        self._thresh_pool.uniform_()
+        self._value_pool.uniform_()
+        self._strength_pool.uniform_()
+        self._idx = 0
+
     def send(self, ignored_arg: Any) -> TensorType["dataset_size_", "activation_dim_"]:
         if self.correlated:
             _, _, data = generate_correlated_dataset(
@@ -58,15 +77,15 @@ class RandomDatasetGenerator(Generator):
                 self.frac_nonzero,
                 self.decay,
                 self.device,
+                mvn=self._mvn,
             )
         else:
-            _, _, data = generate_rand_dataset(
-                self.n_ground_truth_components,
-                self.batch_size,
-                self.component_probs,
-                self.feats,
-                self.device,
-            )
+            i = self._idx
+            dataset_codes = self._value_pool[i] * (self._thresh_pool[i] <= self.component_probs)
+            data = (dataset_codes * self._strength_pool[i]) @ self.feats
+            self._idx += 1
+            if self._idx == self.pool_size:
+                self._refill()
         return data.to(self.t_type)
 
     def throw(self, type: Any = None, value: Any = None, traceback: Any = None) -> None:
@@ -87,6 +106,7 @@ class SparseMixDataset(Generator):
     sparse_component_covariance: Optional[TensorType["n_sparse_components", "n_sparse_components"]] = None
     noise_covariance: Optional[TensorType["activation_dim", "activation_dim"]] = None
     t_type: Optional[torch.dtype] = None
+    seed: Optional[int] = None  # if given, features and correlations are drawn from it and cached in data/
 
     sparse_component_probs: Optional[TensorType["n_sparse_components"]] = field(init=False)
 
@@ -98,11 +118,15 @@ class SparseMixDataset(Generator):
                 self.activation_dim,
                 self.n_sparse_components,
                 device=self.device,
+                seed=self.seed,
             )
 
         if self.sparse_component_covariance is None:
             print("generating covariances...")
-            self.sparse_component_covariance = generate_corr_matrix(self.n_sparse_components, device=self.device)
+            self.sparse_component_covariance = generate_corr_matrix(
+                self.n_sparse_components, device=self.device, seed=self.seed
+            )
+        self._mvn = make_mvn(self.sparse_component_covariance)
 
         if self.noise_covariance is None:
             self.noise_covariance = torch.eye(self.activation_dim, device=self.device)
@@ -126,6 +150,7 @@ class SparseMixDataset(Generator):
             self.frac_nonzero,
             self.sparse_component_probs,
             self.device,
+            mvn=self._mvn,
         )
         noise_data = generate_noise_dataset(
             self.batch_size if batch_size is None else batch_size,
@@ -142,6 +167,16 @@ class SparseMixDataset(Generator):
         raise StopIteration
 
 
+def make_mvn(
+    corr_matrix: TensorType["n_ground_truth_components_", "n_ground_truth_components_"]
+) -> torch.distributions.MultivariateNormal:
+    # factorise once so repeated sampling doesn't redo the Cholesky decomposition
+    return torch.distributions.MultivariateNormal(
+        loc=torch.zeros(corr_matrix.shape[0], device=corr_matrix.device),
+        scale_tril=torch.linalg.cholesky(corr_matrix),
+    )
+
+
 def generate_noise_dataset(
     dataset_size: int,
     noise_covariance: TensorType["activation_dim_", "activation_dim_"],
@@ -168,20 +203,13 @@ def generate_rand_dataset(
     TensorType["dataset_size_", "n_ground_truth_components_"],
     TensorType["dataset_size_", "activation_dim_"],
 ]:
-    dataset_thresh = torch.rand(dataset_size, n_ground_truth_components, device=device)
-    dataset_values = torch.rand(dataset_size, n_ground_truth_components, device=device)
-
-    data_zero = torch.zeros_like(dataset_thresh, device=device)
-
-    dataset_codes = torch.where(
-        dataset_thresh <= feature_probs,
-        dataset_values,
-        data_zero,
-    )  # dim: dataset_size x n_ground_truth_components
+    # only some features are activated, chosen at random: sample the float mask directly with bernoulli,
+    # then scale it in place by the uniform values
+    dataset_codes = torch.bernoulli(feature_probs.expand(dataset_size, n_ground_truth_components))
+    dataset_codes.mul_(torch.rand_like(dataset_codes))  # dim: dataset_size x n_ground_truth_components
 
     # Multiply by a 2D random matrix of feature strengths
-    feature_strengths = torch.rand((dataset_size, n_ground_truth_components), device=device)
-    dataset = (dataset_codes * feature_strengths) @ feats
+    dataset = torch.rand_like(dataset_codes).mul_(dataset_codes) @ feats
 
     # dataset = dataset_codes @ feats
 
@@ -196,21 +224,19 @@ def generate_correlated_dataset(
     frac_nonzero: float,
     decay: TensorType["n_ground_truth_components_"],
     device: Union[torch.device, str],
+    mvn: Optional[torch.distributions.MultivariateNormal] = None,
 ) -> Tuple[
     TensorType["n_ground_truth_components_", "activation_dim_"],
     TensorType["dataset_size_", "n_ground_truth_components_"],
     TensorType["dataset_size_", "activation_dim_"],
 ]:
     # Get a correlated gaussian sample
-    mvn = torch.distributions.MultivariateNormal(
-        loc=torch.zeros(n_ground_truth_components, device=device),
-        covariance_matrix=corr_matrix,
-    )
+    if mvn is None:
+        mvn = make_mvn(corr_matrix)
     corr_thresh = mvn.sample()
 
-    # Take the CDF of that sample.
-    normal = torch.distributions.Normal(torch.tensor([0.0], device=device), torch.tensor([1.0], device=device))
-    cdf = normal.cdf(corr_thresh.squeeze())
+    # Take the (standard normal) CDF of that sample.
+    cdf = 0.5 * (1 + torch.erf(corr_thresh / math.sqrt(2)))
 
     # Decay it
     component_probs = cdf * decay
@@ -222,58 +248,80 @@ def generate_correlated_dataset(
     # So np.isclose(np.mean(component_probs), frac_nonzero) will be True
 
     # Generate sparse correlated codes
-    dataset_thresh = torch.rand(dataset_size, n_ground_truth_components, device=device)
-    dataset_values = torch.rand(dataset_size, n_ground_truth_components, device=device)
-
-    data_zero = torch.zeros_like(corr_thresh, device=device)
-    dataset_codes = torch.where(
-        dataset_thresh <= component_probs,
-        dataset_values,
-        data_zero,
-    )
-    # Ensure there are no datapoints w/ 0 features
-    zero_sample_index = (dataset_codes.count_nonzero(dim=1) == 0).nonzero()[:, 0]
-    random_index = torch.randint(low=0, high=n_ground_truth_components, size=(zero_sample_index.shape[0],)).to(
-        dataset_codes.device
-    )
-    dataset_codes[zero_sample_index, random_index] = 1.0
+    dataset_mask = torch.rand(dataset_size, n_ground_truth_components, device=device) <= component_probs
+    dataset_codes = torch.rand(dataset_size, n_ground_truth_components, device=device).mul_(dataset_mask)
+    # Ensure there are no datapoints w/ 0 features: set a random feature of each empty row to 1
+    # (adding the empty-row mask at one random index per row avoids a host sync on the number of empty rows)
+    empty_rows = dataset_codes.count_nonzero(dim=1) == 0
+    random_index = torch.randint(low=0, high=n_ground_truth_components, size=(dataset_size,), device=device)
+    rows = torch.arange(dataset_size, device=device)
+    dataset_codes[rows, random_index] += empty_rows
 
     # Multiply by a 2D random matrix of feature strengths
     feature_strengths = torch.rand((dataset_size, n_ground_truth_components), device=device)
-    dataset = (dataset_codes * feature_strengths) @ feats
+    dataset = feature_strengths.mul_(dataset_codes) @ feats
 
     return feats, dataset_codes, dataset
 
 
+def numpy_to_device(array: np.ndarray, device: Union[torch.device, str]) -> torch.Tensor:
+    """Copies a (possibly memory-mapped) array to `device` as float32, staging through pinned memory for CUDA."""
+    pin = torch.device(device).type == "cuda"
+    # a single copy (and cast, for older float64 caches) straight from the file into host memory
+    tensor = torch.empty(array.shape, dtype=torch.float32, pin_memory=pin)
+    tensor.numpy()[...] = array
+    return tensor.to(device, non_blocking=pin)
+
+
 def generate_rand_feats(
     feat_dim: int,
     num_feats: int,
     device: Union[torch.device, str],
+    seed: Optional[int] = None,
 ) -> TensorType["n_ground_truth_components_", "activation_dim_"]:
+    # only seeded features are cached, keyed by the seed, so that different seeds never share a cached file
     data_path = os.path.join(os.getcwd(), "data")
-    data_filename = os.path.join(data_path, f"feats_{feat_dim}_{num_feats}.npy")
-
-    feats = np.random.multivariate_normal(np.zeros(feat_dim), np.eye(feat_dim), size=num_feats)
-    feats = feats.T / np.linalg.norm(feats, axis=1)
-    feats = feats.T
-
-    feats_tensor = torch.from_numpy(feats).to(device).float()
+    data_filename = os.path.join(data_path, f"feats_{feat_dim}_{num_feats}_seed{seed}.npy")
+
+    if seed is not None and os.path.exists(data_filename):
+        feats = np.load(data_filename, mmap_mode="r")
+    else:
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        # identity covariance, so a standard normal draw is equivalent to multivariate_normal
+        feats = rng.standard_normal((num_feats, feat_dim))
+        feats = feats.T / np.linalg.norm(feats, axis=1)
+        feats = feats.T.astype(np.float32)
+        if seed is not None:
+            os.makedirs(data_path, exist_ok=True)
+            np.save(data_filename, feats)
+
+    feats_tensor = numpy_to_device(feats, device)
     return feats_tensor
 
 
 def generate_corr_matrix(
-    num_feats: int, device: Union[torch.device, str]
+    num_feats: int, device: Union[torch.device, str], seed: Optional[int] = None
 ) -> TensorType["n_ground_truth_components_", "n_ground_truth_components_"]:
+    # as in generate_rand_feats, only seeded matrices are cached
     corr_mat_path = os.path.join(os.getcwd(), "data")
-    corr_mat_filename = os.path.join(corr_mat_path, f"corr_mat_{num_feats}.npy")
-
-    # Create a correlation matrix
-    corr_matrix = np.random.rand(num_feats, num_feats)
-    corr_matrix = (corr_matrix + corr_matrix.T) / 2
-    min_eig = np.min(np.real(np.linalg.eigvals(corr_matrix)))
-    if min_eig < 0:
-        corr_matrix -= 1.001 * min_eig * np.eye(corr_matrix.shape[0], corr_matrix.shape[1])
-
-    corr_matrix_tensor = torch.from_numpy(corr_matrix).to(device).float()
+    corr_mat_filename = os.path.join(corr_mat_path, f"corr_mat_{num_feats}_seed{seed}.npy")
+
+    if seed is not None and os.path.exists(corr_mat_filename):
+        corr_matrix = np.load(corr_mat_filename, mmap_mode="r")
+    else:
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        # Create a correlation matrix
+        corr_matrix = rng.random((num_feats, num_feats))
+        corr_matrix = (corr_matrix + corr_matrix.T) / 2
+        # symmetric, so eigvalsh gives real eigenvalues directly
+        min_eig = np.min(np.linalg.eigvalsh(corr_matrix))
+        if min_eig < 0:
+            corr_matrix -= 1.001 * min_eig * np.eye(corr_matrix.shape[0], corr_matrix.shape[1])
+        corr_matrix = corr_matrix.astype(np.float32)
+        if seed is not None:
+            os.makedirs(corr_mat_path, exist_ok=True)
+            np.save(corr_mat_filename, corr_matrix)
+
+    corr_matrix_tensor = numpy_to_device(corr_matrix, device)
 
     return corr_matrix_tensor
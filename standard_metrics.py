@@ -1,4 +1,5 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from itertools import product
 import multiprocessing as mp
@@ -23,8 +24,11 @@ import tqdm
 from transformer_lens import HookedTransformer
 
 from autoencoders.learned_dict import LearnedDict
+from config import PICKLE_BUFFER_SIZE
 
-from activation_dataset import setup_data
+from activation_dataset import load_activation_chunk, setup_data
+
+from scipy.optimize import linear_sum_assignment
 
 from sklearn.linear_model import LogisticRegression, Ridge, RidgeClassifier
 from sklearn import metrics
@@ -714,8 +718,8 @@ def calc_for_layer(args) -> Tuple[int, List[Tuple[int, List[Tuple[float, float]]
     base_dir: str
     layer, layer_loc, ratios, device, base_dir = args
 
-    chunk_loc = f"/mnt/ssd-cluster/single_chunks/l{layer}_{'residual' if layer_loc == 'resid' else 'mlp'}/0.pt"
-    activations = torch.load(chunk_loc, map_location=device).to(torch.float32)
+    chunk_folder = f"/mnt/ssd-cluster/single_chunks/l{layer}_{'residual' if layer_loc == 'resid' else 'mlp'}"
+    activations = load_activation_chunk(chunk_folder, 0).to(device=device, dtype=torch.float32)
     dead_feats_data: List[Tuple[int, List[Tuple[float, float]]]] = []
     with torch.no_grad():
         for ratio in ratios:
@@ -751,7 +755,8 @@ def calc_all_activities():
     with mp.Pool(6) as p:
         results = p.map(calc_for_layer, tasks)
 
-    pickle.dump(results, open("n_active_data.pkl", "wb"))
+    with open("n_active_data.pkl", "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+        pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 def calc_kurtosis_for_layer(args) -> Tuple[int, List[Tuple[int, List[Tuple[float, float, float]]]]]:
     layer: int
@@ -761,8 +766,8 @@ def calc_kurtosis_for_layer(args) -> Tuple[int, List[Tuple[int, List[Tuple[float
     base_dir: str
     layer, layer_loc, ratios, device, base_dir = args
 
-    chunk_loc = f"/mnt/ssd-cluster/single_chunks/l{layer}_{'residual' if layer_loc == 'resid' else 'mlp'}/0.pt"
-    activations = torch.load(chunk_loc, map_location=device).to(torch.float32)
+    chunk_folder = f"/mnt/ssd-cluster/single_chunks/l{layer}_{'residual' if layer_loc == 'resid' else 'mlp'}"
+    activations = load_activation_chunk(chunk_folder, 0).to(device=device, dtype=torch.float32)
     dead_feats_data: List[Tuple[int, List[Tuple[float, float, float]]]] = []
     with torch.no_grad():
         for ratio in ratios:
@@ -803,40 +808,53 @@ def calc_all_kurtosis():
     with mp.Pool(6) as p:
         results = p.map(calc_kurtosis_for_layer, tasks)
 
-    pickle.dump(results, open("kurtosis_data.pkl", "wb"))
+    with open("kurtosis_data.pkl", "wb", buffering=PICKLE_BUFFER_SIZE) as f:
+        pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _hungarian_max_cosine_sims(cos_sims):
+    # Use the Hungarian algorithm to solve the assignment problem
+    row_ind, col_ind = linear_sum_assignment(cos_sims)
+    # Retrieve the max cosine similarities and corresponding indices
+    return 1 - cos_sims[row_ind, col_ind]
 
 
-def run_mmcs_with_larger(learned_dicts, threshold=0.9, device: Union[str, torch.device] = "cpu"):
+def run_mmcs_with_larger(learned_dicts, threshold=0.9, device: Union[str, torch.device] = "cpu", n_workers=4):
     n_l1_coefs, n_dict_sizes = len(learned_dicts), len(learned_dicts[0])
     av_mmcs_with_larger_dicts = np.zeros((n_l1_coefs, n_dict_sizes))
     feats_above_threshold = np.zeros((n_l1_coefs, n_dict_sizes))
-    full_max_cosine_sim_for_histograms = np.empty((n_l1_coefs, n_dict_sizes-1), dtype=object)
-
-
-    for l1_ndx, dict_size_ndx in tqdm(list(product(range(n_l1_coefs), range(n_dict_sizes)))):
-        if dict_size_ndx == n_dict_sizes - 1:
-            continue
-        smaller_dict = learned_dicts[l1_ndx][dict_size_ndx]
-        # Clone the larger dict, because we're going to zero it out to do replacements
-        larger_dict_clone = learned_dicts[l1_ndx][dict_size_ndx + 1].clone().to(device)
-        smaller_dict_features, _ = smaller_dict.shape
-        larger_dict_features, _ = larger_dict_clone.shape
-        # Hungary algorithm
-        from scipy.optimize import linear_sum_assignment
-        # Calculate all cosine similarities and store in a 2D array
-        cos_sims = np.zeros((smaller_dict_features, larger_dict_features))
-        for idx, vector in enumerate(smaller_dict):
-            cos_sims[idx] = torch.nn.functional.cosine_similarity(vector.to(device), larger_dict_clone, dim=1).cpu().numpy()
-        # Convert to a minimization problem
-        cos_sims = 1 - cos_sims
-        # Use the Hungarian algorithm to solve the assignment problem
-        row_ind, col_ind = linear_sum_assignment(cos_sims)
-        # Retrieve the max cosine similarities and corresponding indices
-        max_cosine_similarities = 1 - cos_sims[row_ind, col_ind]
+    # one contiguous (n_l1_coefs, n_feats) array per smaller dict size, indexed [dict_size_ndx][l1_ndx]
+    full_max_cosine_sim_for_histograms = {
+        dict_size_ndx: np.empty((n_l1_coefs, learned_dicts[0][dict_size_ndx].shape[0]), dtype=np.float32)
+        for dict_size_ndx in range(n_dict_sizes - 1)
+    }
+
+    def collect(l1_ndx, dict_size_ndx, future):
+        max_cosine_similarities = future.result()
         av_mmcs_with_larger_dicts[l1_ndx, dict_size_ndx] = max_cosine_similarities.mean().item()
         threshold = 0.9
-        feats_above_threshold[l1_ndx, dict_size_ndx] = (max_cosine_similarities > threshold).sum().item() / smaller_dict_features * 100
-        full_max_cosine_sim_for_histograms[l1_ndx][dict_size_ndx] = max_cosine_similarities
+        feats_above_threshold[l1_ndx, dict_size_ndx] = (max_cosine_similarities > threshold).sum().item() / len(max_cosine_similarities) * 100
+        full_max_cosine_sim_for_histograms[dict_size_ndx][l1_ndx] = max_cosine_similarities
+
+    # The Hungarian solves run on a thread pool (scipy releases the GIL) while the next pair's matmul runs.
+    # At most n_workers cost matrices are held at once
+    pending = []
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for l1_ndx, dict_size_ndx in tqdm.tqdm(list(product(range(n_l1_coefs), range(n_dict_sizes)))):
+            if dict_size_ndx == n_dict_sizes - 1:
+                continue
+            smaller_dict = learned_dicts[l1_ndx][dict_size_ndx].to(device)
+            larger_dict = learned_dicts[l1_ndx][dict_size_ndx + 1].to(device)
+            # Calculate all cosine similarities with a single matmul of the row-normalised dicts,
+            # converted to a minimization problem on-device before one transfer to the CPU
+            smaller_dict_normed = torch.nn.functional.normalize(smaller_dict, dim=1, eps=1e-12)
+            larger_dict_normed = torch.nn.functional.normalize(larger_dict, dim=1, eps=1e-12)
+            cos_sims = (1 - torch.mm(smaller_dict_normed, larger_dict_normed.t())).cpu().numpy()
+            pending.append((l1_ndx, dict_size_ndx, pool.submit(_hungarian_max_cosine_sims, cos_sims)))
+            if len(pending) >= n_workers:
+                collect(*pending.pop(0))
+        for l1_ndx, dict_size_ndx, future in pending:
+            collect(l1_ndx, dict_size_ndx, future)
     return av_mmcs_with_larger_dicts, feats_above_threshold, full_max_cosine_sim_for_histograms
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ import os
 import torch
 import tqdm
 
+from activation_dataset import load_activation_chunk
 from autoencoders.ica import ICAEncoder
 from autoencoders.learned_dict import IdentityReLU, RandomDict
 from autoencoders.nmf import NMFEncoder
@@ -29,8 +30,7 @@ def run_layer_baselines(args) -> None:
         folder_name = f"l{layer}_{layer_loc}"
 
         os.makedirs(os.path.join(output_folder, folder_name), exist_ok=True)
-        full_chunk_path = os.path.join(chunks_folder, folder_name, "0.pt")
-        full_chunk = torch.load(full_chunk_path, map_location=device)
+        full_chunk = load_activation_chunk(os.path.join(chunks_folder, folder_name), 0).to(device)
         activation_dim = full_chunk.shape[1]
 
         # Load the learned dict with l1_alpha of 8e-4
@@ -111,8 +111,7 @@ def resave_change_sparsity() -> None:
 
     for layer in range(6):
         folder_name = f"l{layer}_{layer_loc}"
-        full_chunk_path = os.path.join(chunks_folder, folder_name, "0.pt")
-        full_chunk = torch.load(full_chunk_path, map_location=device)
+        full_chunk = load_activation_chunk(os.path.join(chunks_folder, folder_name), 0).to(device)
 
         # Load the learned dict with l1_alpha of 8e-4
         learned_dicts = torch.load(f"/mnt/ssd-cluster/bigrun0308/tied_{layer_loc}_l{layer}_r1/_9/learned_dicts.pt")
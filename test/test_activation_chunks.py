@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import torch
+
+from activation_dataset import (count_activation_chunks, load_activation_chunk,
+                                read_chunk_manifest, save_activation_chunk)
+
+
+class TestActivationChunks(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        # activations are saved as float16, as setup_data does; the last dimension is tiny but not constant
+        self.chunks = [torch.randn(100, 8).to(torch.float16) for _ in range(2)]
+        for chunk in self.chunks:
+            chunk[:, -1] *= 1e-3
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as dataset_folder:
+            for n, chunk in enumerate(self.chunks):
+                # split into batches, as make_activation_dataset passes them
+                save_activation_chunk(list(chunk.split(30)), n, dataset_folder)
+
+            self.assertEqual(count_activation_chunks(dataset_folder), 2)
+            self.assertEqual(read_chunk_manifest(dataset_folder), {"0": 100, "1": 100})
+            for n, chunk in enumerate(self.chunks):
+                loaded = load_activation_chunk(dataset_folder, n)
+                self.assertEqual(loaded.dtype, torch.float16)
+                self.assertTrue(torch.equal(loaded, chunk))
+
+    def test_int8_round_trip(self):
+        with tempfile.TemporaryDirectory() as dataset_folder:
+            for n, chunk in enumerate(self.chunks):
+                save_activation_chunk(list(chunk.split(30)), n, dataset_folder, quantize_int8=True)
+
+            # the {n}_scale.npy files are not counted as chunks
+            self.assertEqual(count_activation_chunks(dataset_folder), 2)
+            for n, chunk in enumerate(self.chunks):
+                loaded = load_activation_chunk(dataset_folder, n)
+                self.assertEqual(loaded.dtype, torch.float32)
+                # rounding to the nearest of 127 steps per dimension errs by at most half a step
+                half_step = chunk.float().abs().amax(dim=0) / 127 / 2
+                error = (loaded - chunk.float()).abs()
+                self.assertTrue((error <= half_step * 1.001).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import torch
+
+from replicate_toy_models import BatchedAutoEncoder, batched_loss
+
+
+class TestBatchedAutoEncoder(unittest.TestCase):
+    def test_matches_separate_autoencoders(self):
+        torch.manual_seed(0)
+        activation_size, n_dict_components = 16, 32
+        l1_alphas = [1e-3, 1e-2, 1e-1]
+        batched = BatchedAutoEncoder(len(l1_alphas), activation_size, n_dict_components)
+        separate = batched.unstack()
+        batch = torch.randn(64, activation_size)
+
+        l_reconstruction, l_l1 = batched_loss(batched, batch, torch.tensor(l1_alphas))
+        (l_reconstruction + l_l1).sum().backward()
+
+        for i, (auto_encoder, l1_alpha) in enumerate(zip(separate, l1_alphas)):
+            # the per-model loss of the original, unbatched run_single_go
+            x_hat, c = auto_encoder(batch)
+            single_reconstruction = torch.nn.MSELoss()(batch, x_hat)
+            single_l1 = l1_alpha * torch.norm(c, 1, dim=1).mean() / c.size(1)
+            (single_reconstruction + single_l1).backward()
+
+            torch.testing.assert_close(l_reconstruction[i], single_reconstruction.detach())
+            torch.testing.assert_close(l_l1[i], single_l1.detach())
+            torch.testing.assert_close(batched.encoder_weight.grad[i], auto_encoder.encoder[0].weight.grad.t())
+            torch.testing.assert_close(batched.encoder_bias.grad[i], auto_encoder.encoder[0].bias.grad)
+            torch.testing.assert_close(batched.decoder_weight.grad[i], auto_encoder.decoder.weight.grad.t())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+import warnings
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from scipy.stats import pointbiserialr
+
+from interpret_autoencoder import point_biserial_matrix
+
+
+class TestPointBiserial(unittest.TestCase):
+    def test_matches_scipy(self):
+        np.random.seed(0)
+        n_labels, n_feats, n_samples = 4, 6, 500
+        labels = (np.random.rand(n_labels, n_samples) > 0.5).astype(np.float32)
+        activations = np.random.randn(n_feats, n_samples).astype(np.float32)
+        # a strongly correlated pair, a constant label row and a dead (all-zero) feature
+        activations[1] += 2 * labels[2]
+        labels[0] = 1.0
+        activations[5] = 0.0
+
+        with mock.patch("torch.cuda.is_available", return_value=False):
+            r_matrix, p_matrix = point_biserial_matrix(labels, activations)
+
+        expected_r = np.zeros((n_labels, n_feats))
+        expected_p = np.zeros((n_labels, n_feats))
+        with warnings.catch_warnings():
+            # scipy warns (and returns nan) for the constant rows
+            warnings.simplefilter("ignore")
+            for i in range(n_labels):
+                for j in range(n_feats):
+                    expected_r[i, j], expected_p[i, j] = pointbiserialr(labels[i], activations[j])
+
+        self.assertEqual(r_matrix.shape, (n_labels, n_feats))
+        self.assertTrue(np.isnan(r_matrix[0]).all())
+        self.assertTrue(np.isnan(r_matrix[:, 5]).all())
+        np.testing.assert_allclose(r_matrix, expected_r, atol=1e-5, equal_nan=True)
+        np.testing.assert_allclose(p_matrix, expected_p, atol=1e-5, equal_nan=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 import json
 import os
+import shlex
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Union
 
@@ -15,6 +17,17 @@ SSH_PYTHON = "/opt/conda/bin/python"
 
 PORT = 22
 
+# Share one persistent, authenticated connection to DEST_ADDR between all ssh/scp/rsync calls below,
+# encrypted with AES-GCM so bulk transfers use AES-NI and skip a separate MAC pass
+SSH_OPTIONS = (
+    "-o", "ControlMaster=auto", "-o", "ControlPath=~/.ssh/cm-%r@%h:%p", "-o", "ControlPersist=10m",
+    "-c", "aes128-gcm@openssh.com",
+)
+# argv prefixes for ssh and scp, and the equivalent string for rsync's -e, built once
+SSH_ARGV = ("ssh", *SSH_OPTIONS, "-p", str(PORT))
+SCP_ARGV = ("scp", *SSH_OPTIONS, "-P", str(PORT))
+RSYNC_SSH = shlex.join(SSH_ARGV)
+
 USER = "hoagy"
 
 SSH_DIRECTORY = f"sparse_coding_{USER}"
@@ -29,67 +42,74 @@ ACCESS_KEY_NAME_DICT = {
 
 def sync():
     """Sync the local directory with the remote host."""
-    command = f'rsync -rv --filter ":- .gitignore" --exclude ".git" -e "ssh -p {PORT}" . {DEST_ADDR}:{SSH_DIRECTORY}'
-    subprocess.call(command, shell=True)
+    # -a keeps mtimes so rsync's quick check skips unchanged files, -z compresses the (mostly text) stream.
+    # Interrupted files wait in .rsync-partial (so a half-sent file never replaces a good one) and are resumed from there
+    command = [
+        "rsync", "-az", "--compress-level=3", "--partial-dir=.rsync-partial", "--preallocate", "--info=progress2",
+        "--filter=:- .gitignore", "--exclude=.git", "-e", RSYNC_SSH, ".", f"{DEST_ADDR}:{SSH_DIRECTORY}",
+    ]
+    subprocess.run(command)
 
 
 def datasets_sync():
     """Sync .csv files with the remote host."""
-    command = f'rsync -am --include "*.csv" --exclude "*" -e "ssh -p {PORT}" . {DEST_ADDR}:{SSH_DIRECTORY}'
-    subprocess.call(command, shell=True)
+    command = ["rsync", "-am", "--include=*.csv", "--exclude=*", "-e", RSYNC_SSH, ".", f"{DEST_ADDR}:{SSH_DIRECTORY}"]
+    subprocess.run(command)
 
 
 def autointerp_sync():
     """Sync the local directory with the remote host's auto interp results, excluding hdf files."""
-    command = f'rsync -r --exclude "*.hdf" --exclude "*.pkl" -e ssh {DEST_ADDR}:/mnt/ssd-cluster/auto_interp_results/ ./auto_interp_results'
-    print(command)
-    subprocess.call(command, shell=True)
+    command = ["rsync", "-r", "--exclude=*.hdf", "--exclude=*.pkl", "-e", RSYNC_SSH, f"{DEST_ADDR}:/mnt/ssd-cluster/auto_interp_results/", "./auto_interp_results"]
+    print(shlex.join(command))
+    subprocess.run(command)
 
 
 def copy_models():
-    """Copy the models from local directory to the remote host."""
-    command = f"scp -P {PORT} -r models {DEST_ADDR}:{SSH_DIRECTORY}/models"
-    subprocess.call(command, shell=True)
+    """Copy the models from local directory to the remote host, skipping unchanged files and resuming partial ones."""
+    command = ["rsync", "-av", "--partial-dir=.rsync-partial", "-e", RSYNC_SSH, "models/", f"{DEST_ADDR}:{SSH_DIRECTORY}/models/"]
+    subprocess.run(command)
     # also copying across a few other files
-    command = f"scp -P {PORT} -r outputs/thinrun/autoencoders_cpu.pkl {DEST_ADDR}:{SSH_DIRECTORY}"
-    subprocess.call(command, shell=True)
+    command = [*SCP_ARGV, "-r", "outputs/thinrun/autoencoders_cpu.pkl", f"{DEST_ADDR}:{SSH_DIRECTORY}"]
+    subprocess.run(command)
 
 
 def copy_secrets():
     """Copy the secrets.json file from local directory to the remote host."""
-    command = f"scp -P {PORT} secrets.json {DEST_ADDR}:{SSH_DIRECTORY}"
-    subprocess.call(command, shell=True)
+    command = [*SCP_ARGV, "secrets.json", f"{DEST_ADDR}:{SSH_DIRECTORY}"]
+    subprocess.run(command)
 
 
 def copy_recent():
     """Get the most recent outputs folder in the remote host and copy across to same place in local directory."""
-    # get the most recent folders
-    command = f'ssh -p {PORT} {DEST_ADDR} "ls -td {SSH_DIRECTORY}/outputs/* | head -1"'
-    output = subprocess.check_output(command, shell=True)
-    output = output.decode("utf-8").strip()
-    # copy across
-    command = f"scp -P {PORT} -r {DEST_ADDR}:{output} outputs"
-    subprocess.call(command, shell=True)
+    # find the most recent folder and stream it back as a tar in the same ssh session
+    remote_command = f'cd {SSH_DIRECTORY} && d=$(ls -td outputs/* | head -1) && tar cf - "$d"'
+    ssh = subprocess.Popen([*SSH_ARGV, DEST_ADDR, remote_command], stdout=subprocess.PIPE)
+    tar = subprocess.Popen(["tar", "xf", "-"], stdin=ssh.stdout)
+    ssh.stdout.close()
+    tar.wait()
+    ssh.wait()
 
 
 def copy_dotfiles():
     """Copy dotfiles into remote host and run install and deploy scripts"""
     df_dir = f"dotfiles_{USER}"
     # command = f"scp -P {PORT} -r ~/git/dotfiles {DEST_ADDR}:{df_dir}"
-    command = f"rsync -rv --filter ':- .gitignore' --exclude '.git' -e 'ssh -p {PORT}' ~/git/ {DEST_ADDR}:{df_dir}"
-    subprocess.call(command, shell=True)
-    command = f"ssh -p {PORT} {DEST_ADDR} 'cd ~/{df_dir} && ./install.sh && ./deploy.sh'"
-    subprocess.call(command, shell=True)
+    command = ["rsync", "-rv", "--filter=:- .gitignore", "--exclude=.git", "-e", RSYNC_SSH, os.path.expanduser("~/git/"), f"{DEST_ADDR}:{df_dir}"]
+    subprocess.run(command)
+    command = [*SSH_ARGV, DEST_ADDR, f"cd ~/{df_dir} && ./install.sh && ./deploy.sh"]
+    subprocess.run(command)
 
 
 def setup():
     """Sync, copy models, create venv and install requirements."""
+    # sync creates SSH_DIRECTORY, after which the models and secrets go to disjoint paths and can copy concurrently
     sync()
-    copy_models()
-    copy_secrets()
-    command = f'ssh -p {PORT} {DEST_ADDR} "cd {SSH_DIRECTORY} && sudo apt -y install python3.9 python3.9-venv && python3.9 -m venv .env --system-site-packages && source .env/bin/activate && pip install -r requirements.txt" && apt install vim'
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for copy in [pool.submit(copy_models), pool.submit(copy_secrets)]:
+            copy.result()
+    remote_command = f"cd {SSH_DIRECTORY} && sudo apt -y install python3.9 python3.9-venv vim && python3.9 -m venv .env --system-site-packages && source .env/bin/activate && pip install -r requirements.txt"
     # command = f"ssh -p {VAST_PORT} {dest_addr} \"cd {SSH_DIRECTORY} && echo $PATH\""
-    subprocess.call(command, shell=True)
+    subprocess.run([*SSH_ARGV, DEST_ADDR, remote_command])
 
 
 import warnings
@@ -107,9 +127,10 @@ class dotdict(dict):
         return self
 
     def __getattr__(self, name):
-        if name in self:
+        # keys never live in the instance __dict__, so every cfg.foo lands here: look it up once
+        try:
             return self[name]
-        else:
+        except KeyError:
             raise AttributeError(f"Attribute {name} not found")
 
     def __setattr__(self, name, value):
@@ -201,22 +222,21 @@ def download_from_aws(files: Union[str, List[str]], force_redownload: bool = Fal
     return all_correct
 
 
+COMMANDS = {
+    "sync": sync,
+    "models": copy_models,
+    "recent": copy_recent,
+    "setup": setup,
+    "secrets": copy_secrets,
+    "interp_sync": autointerp_sync,
+    "dotfiles": copy_dotfiles,
+    "datasets": datasets_sync,
+}
+
+
 if __name__ == "__main__":
-    if sys.argv[1] == "sync":
-        sync()
-    elif sys.argv[1] == "models":
-        copy_models()
-    elif sys.argv[1] == "recent":
-        copy_recent()
-    elif sys.argv[1] == "setup":
-        setup()
-    elif sys.argv[1] == "secrets":
-        copy_secrets()
-    elif sys.argv[1] == "interp_sync":
-        autointerp_sync()
-    elif sys.argv[1] == "dotfiles":
-        copy_dotfiles()
-    elif sys.argv[1] == "datasets":
-        datasets_sync()
-    else:
+    if len(sys.argv) < 2:
+        sys.exit(f"usage: {sys.argv[0]} {{{'|'.join(COMMANDS)}}}")
+    if sys.argv[1] not in COMMANDS:
         raise NotImplementedError(f"Command {sys.argv[1]} not recognised")
+    COMMANDS[sys.argv[1]]()